@@ -1,10 +1,61 @@
-from flask import Flask, request, jsonify
-from sympy import symbols, Eq, solve, diff, integrate, pi, exp, sin, cos, tan, log, sqrt
-from sympy.solvers.inequalities import solve_univariate_inequality
-from sympy.parsing.sympy_parser import parse_expr
+from flask import Flask, request, jsonify, Response
+from sympy import symbols, Eq, solve, diff, integrate, pi, exp, sin, cos, tan, log, sqrt, lambdify, zoo
+from sympy import Poly, Float, I, S, roots, Symbol, Integer, zeros, linsolve, expand, Add, Mul, Pow
+from sympy import (Rational, Function, E, oo, cot, sec, csc, asin, acos, atan, atan2, sinh, cosh,
+                   tanh, asinh, acosh, atanh, Abs, floor, ceiling, factorial, sign, Min, Max, root, cbrt)
+from sympy import AccumBounds, Dummy, Integral, Interval, Ne, Piecewise, QQ, Lt, Le, Gt, Ge, intervals, together, limit as sympy_limit
+from sympy.calculus.singularities import singularities
+from sympy.core.function import FunctionClass
+from sympy.calculus.util import periodicity
+from sympy.integrals.rationaltools import ratint
+from sympy.polys.polyerrors import PolynomialError
+from sympy.parsing.sympy_parser import parse_expr, standard_transformations
+import mpmath
 import re
 from flask_cors import CORS
+import click
+import atexit
+import base64
+import bisect
+import contextvars
+import cProfile
+import gzip
+import hashlib
+import importlib
+import io
 import json
+import keyword
+import math
+import multiprocessing
+import os
+import pstats
+import queue
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import tokenize
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+class LazyModule:
+    """Stand-in for a module that is only imported when first used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# NumPy is only needed for graphs and numeric paths, so keep it off the import path
+np = LazyModule("numpy")
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS to allow Flutter to make requests
@@ -12,148 +63,2881 @@ CORS(app)  # Enable CORS to allow Flutter to make requests
 # Define symbols
 x, y, z, t, a, b, c, n = symbols('x y z t a b c n')
 
-def safe_eval(expr_str, local_dict=None):
-    """Safely evaluate a mathematical expression."""
+# Per-request stage timings: parse, steps, graph and serialize are measured, and
+# "solve" is whatever a solve spends outside them
+
+class StageTimings:
+    """Seconds spent in each stage while solving one request."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.active = None
+
+_stage_timings = contextvars.ContextVar("stage_timings", default=None)
+
+@contextmanager
+def timed_stage(name):
+    """Charge the time spent in the block to a stage of the current solve.
+
+    Nested stages are charged to the outermost one, and nothing is recorded
+    outside a timed solve.
+    """
+    timings = _stage_timings.get()
+    if timings is None or timings.active is not None:
+        yield
+        return
+    timings.active = name
+    start = time.perf_counter()
     try:
-        # Try to parse the expression with sympy's parser
-        return parse_expr(expr_str)
-    except Exception as e:
-        # If sympy parsing fails, try direct evaluation with limited locals
-        local_dict = local_dict or {"x": x, "y": y, "z": z, "t": t, "a": a, "b": b, "c": c, "n": n,
-                               "sin": sin, "cos": cos, "tan": tan, "exp": exp, "log": log, "sqrt": sqrt, "pi": pi}
-        return eval(expr_str, {"__builtins__": {}}, local_dict)
+        yield
+    finally:
+        timings.active = None
+        timings.seconds[name] = timings.seconds.get(name, 0.0) + time.perf_counter() - start
+
+def timed(name):
+    """Decorator form of timed_stage."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed_stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Solution steps: "none" returns no steps, "summary" only the first and the last,
+# "full" all of them
+VERBOSITY_LEVELS = ("none", "summary", "full")
+# Expressions rendered into a step are cut to this many characters
+STEP_EXPRESSION_CHARS = int(os.environ.get("STEP_EXPRESSION_CHARS", 2000))
+
+def _step_value(value):
+    text = str(value)
+    if len(text) > STEP_EXPRESSION_CHARS:
+        return f"{text[:STEP_EXPRESSION_CHARS]}… ({len(text)} characters)"
+    return text
+
+class StepLog:
+    """Solution steps, kept as templates and values until the response is built.
+
+    Nothing is recorded at verbosity "none", and values are only turned into
+    (capped) text for the steps that are actually returned.
+    """
+
+    def __init__(self, verbosity="full"):
+        self.verbosity = verbosity
+        self.enabled = verbosity != "none"
+        self.entries = []
+
+    def add(self, template, *values):
+        """Record a step whose {} placeholders are filled with values when rendered."""
+        if self.enabled:
+            self.entries.append((template, values))
+
+    def append(self, text):
+        if self.enabled:
+            self.entries.append((text, None))
+
+    def extend(self, texts):
+        for text in texts:
+            self.append(text)
+
+    def render(self):
+        entries = self.entries
+        if self.verbosity == "summary" and len(entries) > 2:
+            entries = [entries[0], entries[-1]]
+        with timed_stage("steps"):
+            return [text if values is None else text.format(*map(_step_value, values))
+                    for text, values in entries]
+
+# Expression parser
+PARSE_CACHE_SIZE = int(os.environ.get("PARSE_CACHE_SIZE", 4096))
+
+# The only names user input can refer to; any other name becomes a plain symbol
+PARSER_NAMESPACE = {
+    "x": x, "y": y, "z": z, "t": t, "a": a, "b": b, "c": c, "n": n,
+    "pi": pi, "E": E, "I": I, "oo": oo,
+    "sin": sin, "cos": cos, "tan": tan, "cot": cot, "sec": sec, "csc": csc,
+    "asin": asin, "acos": acos, "atan": atan, "atan2": atan2,
+    "sinh": sinh, "cosh": cosh, "tanh": tanh, "asinh": asinh, "acosh": acosh, "atanh": atanh,
+    "exp": exp, "log": log, "ln": log, "sqrt": sqrt, "cbrt": cbrt, "root": root,
+    "Abs": Abs, "abs": Abs, "floor": floor, "ceiling": ceiling, "factorial": factorial,
+    "sign": sign, "Min": Min, "Max": Max
+}
+
+# Globals for the code parse_expr generates: the whitelist plus the constructors
+# its transformations (and evaluate=False) emit, and no builtins
+_PARSER_GLOBALS = dict(PARSER_NAMESPACE, Symbol=Symbol, Integer=Integer, Float=Float,
+                       Rational=Rational, Function=Function, Add=Add, Mul=Mul, Pow=Pow,
+                       __builtins__={})
+_PARSER_TRANSFORMATIONS = standard_transformations
+# Operators a math expression may use; brackets, braces, dots, lambdas and string
+# literals are rejected before parse_expr ever runs the input as Python
+_ALLOWED_OPERATORS = frozenset(("+", "-", "*", "/", "**", "//", "%", "(", ")", ",",
+                                "<", ">", "<=", ">=", "==", "!=", "!"))
+_LAYOUT_TOKENS = (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER)
+
+def check_math_syntax(expr_str):
+    """Raise ValueError unless the input is names, numbers and arithmetic or comparison operators.
+
+    Parentheses are only for grouping and calls, so commas may only separate call arguments.
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(expr_str).readline))
+    except (tokenize.TokenError, SyntaxError) as e:
+        raise ValueError(f"Invalid expression: {expr_str}") from e
+    calls = []
+    previous = None
+    for token in tokens:
+        kind, text = token.type, token.string
+        if kind == tokenize.NAME:
+            if keyword.iskeyword(text) or "__" in text:
+                raise ValueError(f"Unsupported syntax in expression: {text}")
+        elif kind in (tokenize.OP, tokenize.ERRORTOKEN):
+            if text not in _ALLOWED_OPERATORS:
+                raise ValueError(f"Unsupported syntax in expression: {text}")
+            if text == "(":
+                calls.append(previous is not None and previous.type == tokenize.NAME)
+            elif text == ")":
+                if not calls:
+                    raise ValueError(f"Unbalanced parentheses in expression: {expr_str}")
+                calls.pop()
+            elif text == "," and not (calls and calls[-1]):
+                raise ValueError(f"Unsupported syntax in expression: {expr_str}")
+        elif kind != tokenize.NUMBER and kind not in _LAYOUT_TOKENS:
+            raise ValueError(f"Unsupported syntax in expression: {text}")
+        previous = token
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_math(expr_str, evaluate=True):
+    """Parse a mathematical expression against the whitelisted namespace.
+
+    Results are memoized, which is safe because SymPy expressions are immutable.
+    """
+    check_math_syntax(expr_str)
+    # Only cache misses are timed; hits cost next to nothing
+    with timed_stage("parse"):
+        return parse_expr(expr_str, local_dict={}, global_dict=_PARSER_GLOBALS,
+                          transformations=_PARSER_TRANSFORMATIONS, evaluate=evaluate)
+
+# For estimation: the same names, but every function class is an inert placeholder, so
+# even evaluate=False parsing never runs a call such as factorial(10**6); sqrt, cbrt
+# and root only build powers
+_INERT_GLOBALS = dict(_PARSER_GLOBALS, **{name: Function(name) for name, value in PARSER_NAMESPACE.items()
+                                          if isinstance(value, FunctionClass)})
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_inert(expr_str):
+    """Parse an expression into an unevaluated tree without evaluating any function."""
+    check_math_syntax(expr_str)
+    return parse_expr(expr_str, local_dict={}, global_dict=_INERT_GLOBALS,
+                      transformations=_PARSER_TRANSFORMATIONS, evaluate=False)
+
+# Graph sampling
+GRAPH_POINTS = int(os.environ.get("GRAPH_POINTS", 1001))
+MAX_GRAPH_POINTS = int(os.environ.get("MAX_GRAPH_POINTS", 5000))
+# Largest tolerated midpoint deviation, as a fraction of the viewport height
+GRAPH_TOLERANCE = 0.001
+# Jumps bigger than this fraction of the viewport height are checked for breaks
+DISCONTINUITY_JUMP = 0.05
+# Poles and edges of undefined regions are located to this fraction of the viewport width
+EDGE_RESOLUTION = 1e-4
+# The first pass probes a grid this many times finer than the starting grid, so
+# oscillation faster than the starting grid is not aliased away
+GRAPH_PROBE_FACTOR = 8
+
+def compile_function(expr, var):
+    """Compile an expression once into a vectorized NumPy function of var."""
+    func = lambdify(var, expr, modules="numpy")
+
+    def evaluate(x_vals):
+        with np.errstate(all='ignore'):
+            y_vals = np.asarray(func(x_vals))
+            # Constant expressions come back as a scalar
+            y_vals = np.broadcast_to(y_vals, x_vals.shape)
+            if np.iscomplexobj(y_vals):
+                y_vals = np.where(np.abs(y_vals.imag) < 1e-12, y_vals.real, np.nan)
+            y_vals = y_vals.astype(float)
+        # Poles, overflows and complex values are treated as undefined
+        return np.where(np.isfinite(y_vals), y_vals, np.nan)
+
+    return evaluate
+
+def parse_graph_options(graph):
+    """Validate the optional 'graph' request field into sampling settings."""
+    settings = {"points": GRAPH_POINTS}
+    if graph is None:
+        return settings
+    if not isinstance(graph, dict):
+        raise ValueError("graph must be an object")
+
+    if 'points' in graph:
+        points = int(graph['points'])
+        if points < 2:
+            raise ValueError("graph.points must be at least 2")
+        settings['points'] = min(points, MAX_GRAPH_POINTS)
+    for key in ('xMin', 'xMax', 'yMin', 'yMax'):
+        if key in graph:
+            value = float(graph[key])
+            if not np.isfinite(value):
+                raise ValueError(f"graph.{key} must be finite")
+            settings[key] = value
+    if 'xMin' in settings and 'xMax' in settings and settings['xMin'] >= settings['xMax']:
+        raise ValueError("graph.xMin must be less than graph.xMax")
+    if 'yMin' in settings and 'yMax' in settings and settings['yMin'] >= settings['yMax']:
+        raise ValueError("graph.yMin must be less than graph.yMax")
+    return settings
+
+def _y_band(y_vals_list, y_range):
+    """Return the (low, high) vertical band used to judge sampling error and jumps."""
+    if y_range is not None:
+        return y_range
+    finite = np.concatenate([y_vals[np.isfinite(y_vals)] for y_vals in y_vals_list])
+    if finite.size == 0:
+        return -0.5, 0.5
+    # Percentiles keep a pole from flattening the rest of the curve
+    low, high = np.percentile(finite, [5, 95])
+    if high <= low:
+        low, high = finite.min(), finite.max()
+    if high <= low:
+        low, high = low - 0.5, high + 0.5
+    return float(low), float(high)
+
+def _jump_persists(func, a, b, fa, fb, jump, edge_width):
+    """Bisect segments down to edge_width, following the half with the bigger jump.
+
+    Returns (mask, location): the mask marks segments whose jump still exceeds jump
+    at that width or that run into an undefined value, which are poles, steps and
+    edges rather than a steep but continuous stretch, and location is where each
+    search ended. These extra evaluations are not part of the samples.
+    """
+    a, b, fa, fb = a.copy(), b.copy(), fa.copy(), fb.copy()
+    undefined = np.zeros(len(a), dtype=bool)
+    while True:
+        active = np.nonzero((b - a > edge_width) & ~undefined)[0]
+        if len(active) == 0:
+            break
+        m = (a[active] + b[active]) / 2
+        fm = func(m)
+        undefined[active[np.isnan(fm)]] = True
+        first = np.abs(fm - fa[active]) >= np.abs(fb[active] - fm)
+        b[active[first]], fb[active[first]] = m[first], fm[first]
+        a[active[~first]], fa[active[~first]] = m[~first], fm[~first]
+    return undefined | (np.abs(fb - fa) > jump), (a + b) / 2
+
+def adaptive_sample(funcs, x_min, x_max, budget=GRAPH_POINTS, y_range=None):
+    """Sample vectorized functions on a shared grid refined where they bend the most.
+
+    Returns (x_vals, [y_vals, ...], discontinuities). Points are added where the
+    midpoint of a segment strays furthest from the straight line between its ends,
+    until the budget is spent or the curve is within tolerance. Off-screen stretches
+    are not refined, and poles and undefined edges only down to EDGE_RESOLUTION.
+    Detected jumps and poles get a NaN separator row so the curve is broken there
+    instead of drawn across the asymptote; separator rows count against the budget.
+    """
+    initial = max(min(budget, 17), budget // 8)
+    probe_x = np.linspace(x_min, x_max, (initial - 1) * GRAPH_PROBE_FACTOR + 1)
+    probe_list = [func(probe_x) for func in funcs]
+    low, high = _y_band(probe_list, y_range)
+    scale = high - low
+    # Curve detail more than a band height above or below the band is off screen
+    bottom, top = low - scale, high + scale
+    min_width = (x_max - x_min) * 1e-9
+    edge_width = (x_max - x_min) * EDGE_RESOLUTION
+
+    # Start from every GRAPH_PROBE_FACTOR-th probe, plus all probes of the starting
+    # segments that the coarse grid alone would draw wrongly
+    error = np.zeros(initial - 1)
+    for probe_vals in probe_list:
+        rows = probe_vals[:-1].reshape(initial - 1, GRAPH_PROBE_FACTOR)
+        left = rows[:, :1]
+        right = probe_vals[GRAPH_PROBE_FACTOR::GRAPH_PROBE_FACTOR][:, None]
+        along = np.arange(GRAPH_PROBE_FACTOR) / GRAPH_PROBE_FACTOR
+        deviation = np.abs(rows - (left + (right - left) * along)) / scale
+        undefined = np.isnan(deviation) & ~(np.isnan(rows) & np.isnan(left) & np.isnan(right))
+        deviation = np.where(undefined, 1.0, np.nan_to_num(deviation)).max(axis=1)
+        off_screen = (((rows > top).all(axis=1) & (right[:, 0] > top))
+                      | ((rows < bottom).all(axis=1) & (right[:, 0] < bottom)))
+        deviation[off_screen] = 0
+        error = np.maximum(error, deviation)
+    rough = np.nonzero(error > GRAPH_TOLERANCE)[0]
+    room = (budget - initial) // (GRAPH_PROBE_FACTOR - 1)
+    rough = rough[np.argsort(error[rough])[::-1][:room]]
+    keep = np.zeros(len(probe_x), dtype=bool)
+    keep[::GRAPH_PROBE_FACTOR] = True
+    keep[:-1].reshape(initial - 1, GRAPH_PROBE_FACTOR)[rough] = True
+    x_vals = probe_x[keep]
+    y_vals_list = [probe_vals[keep] for probe_vals in probe_list]
+
+    while len(x_vals) < budget:
+        mids = (x_vals[:-1] + x_vals[1:]) / 2
+        error = np.zeros(len(mids))
+        mid_vals_list = [func(mids) for func in funcs]
+        for y_vals, mid_vals in zip(y_vals_list, mid_vals_list):
+            left, right = y_vals[:-1], y_vals[1:]
+            deviation = np.abs(mid_vals - (left + right) / 2) / scale
+            # A segment touching an undefined point is refined to locate the edge or pole
+            undefined = np.isnan(deviation) & ~(np.isnan(left) & np.isnan(right) & np.isnan(mid_vals))
+            deviation = np.where(undefined, 1.0, np.nan_to_num(deviation))
+            off_screen = (((left > top) & (right > top) & (mid_vals > top))
+                          | ((left < bottom) & (right < bottom) & (mid_vals < bottom)))
+            deviation[off_screen] = 0
+            error = np.maximum(error, deviation)
+        widths = np.diff(x_vals)
+        error[widths < min_width] = 0
+        # Segments at a pole or an undefined value would otherwise take the whole budget
+        error[(error >= 1.0) & (widths < edge_width)] = 0
+
+        candidates = np.nonzero(error > GRAPH_TOLERANCE)[0]
+        if len(candidates) == 0:
+            break
+        room = budget - len(x_vals)
+        if len(candidates) > room:
+            candidates = np.sort(candidates[np.argsort(error[candidates])[::-1][:room]])
+        x_vals = np.insert(x_vals, candidates + 1, mids[candidates])
+        y_vals_list = [np.insert(y_vals, candidates + 1, mid_vals[candidates])
+                       for y_vals, mid_vals in zip(y_vals_list, mid_vals_list)]
+
+    # A large jump whose midpoint does not land between the two ends is a pole or step
+    breaks = np.zeros(len(x_vals) - 1, dtype=bool)
+    mids = (x_vals[:-1] + x_vals[1:]) / 2
+    # Where in its segment each break lies
+    spots = mids.copy()
+    for func, y_vals in zip(funcs, y_vals_list):
+        left, right = y_vals[:-1], y_vals[1:]
+        jump = np.abs(right - left)
+        suspect = np.nonzero(jump > DISCONTINUITY_JUMP * scale)[0]
+        if len(suspect) == 0:
+            continue
+        mid_vals = func(mids[suspect])
+        low = np.minimum(left[suspect], right[suspect])
+        high = np.maximum(left[suspect], right[suspect])
+        outside = (mid_vals < low) | (mid_vals > high) | np.isnan(mid_vals)
+        lopsided = np.minimum(np.abs(mid_vals - low), np.abs(high - mid_vals)) < 0.05 * jump[suspect]
+        # Off screen the samples are sparse, so a steep but continuous stretch looks lopsided
+        lopsided &= (high >= bottom) & (low <= top)
+        suspect = suspect[(outside | lopsided) & ~breaks[suspect]]
+        # A peak or steep stretch the budget left coarse looks the same, so confirm it
+        confirmed, located = _jump_persists(func, x_vals[suspect], x_vals[suspect + 1],
+                                            left[suspect], right[suspect],
+                                            DISCONTINUITY_JUMP * scale, edge_width)
+        breaks[suspect[confirmed]] = True
+        spots[suspect[confirmed]] = located[confirmed]
+
+    # Consecutive flagged segments straddle one pole: blank the points between them
+    # and report it once instead of once per segment
+    runs = np.diff(np.concatenate([[0], breaks.astype(np.int8), [0]]))
+    for start, end in zip(np.nonzero(runs == 1)[0], np.nonzero(runs == -1)[0]):
+        if end - start > 1:
+            breaks[start:end] = False
+            for y_vals in y_vals_list:
+                y_vals[start + 1:end] = np.nan
+
+    found = spots[breaks].tolist()
+    # Isolated undefined points between defined neighbours are removable gaps or poles
+    for y_vals in y_vals_list:
+        defined = np.isfinite(y_vals)
+        isolated = ~defined[1:-1] & defined[:-2] & defined[2:]
+        found.extend(x_vals[1:-1][isolated].tolist())
+    for y_vals in y_vals_list:
+        # Blanked runs around a pole
+        defined = np.isfinite(y_vals)
+        edges = np.diff(defined.astype(np.int8))
+        for start, end in zip(np.nonzero(edges == -1)[0] + 1, np.nonzero(edges == 1)[0] + 1):
+            if end > start and x_vals[end - 1] - x_vals[start] < edge_width * 4:
+                found.append(float((x_vals[start] + x_vals[end - 1]) / 2))
+    discontinuities = []
+    for point in sorted(found):
+        if discontinuities and point - discontinuities[-1] < edge_width * 4:
+            continue
+        discontinuities.append(point)
+
+    excess = len(x_vals) + int(breaks.sum()) - budget
+    if excess > 0:
+        # Make room for the separator rows by dropping the points the curve misses
+        # least: defined points with defined neighbours away from any break
+        inner = np.arange(1, len(x_vals) - 1)
+        along = (x_vals[1:-1] - x_vals[:-2]) / (x_vals[2:] - x_vals[:-2])
+        cost = np.zeros(len(inner))
+        for y_vals in y_vals_list:
+            chord = y_vals[:-2] + (y_vals[2:] - y_vals[:-2]) * along
+            cost = np.maximum(cost, np.abs(y_vals[1:-1] - chord))
+        movable = ~np.isnan(cost) & ~breaks[:-1] & ~breaks[1:]
+        drop = inner[movable][np.argsort(cost[movable])[:excess]]
+        x_vals = np.delete(x_vals, drop)
+        y_vals_list = [np.delete(y_vals, drop) for y_vals in y_vals_list]
+        breaks = np.delete(breaks, drop)
+        spots = np.delete(spots, drop)
+        # Whatever still does not fit is drawn joined rather than over budget
+        spare = max(budget - len(x_vals), 0)
+        breaks[np.nonzero(breaks)[0][spare:]] = False
+
+    if breaks.any():
+        positions = np.nonzero(breaks)[0] + 1
+        x_vals = np.insert(x_vals, positions, spots[breaks])
+        y_vals_list = [np.insert(y_vals, positions, np.nan) for y_vals in y_vals_list]
+    return x_vals, y_vals_list, discontinuities
+
+@timed("graph")
+def sample_functions(funcs, x_min, x_max, settings=None):
+    """Sample vectorized functions adaptively over the requested viewport."""
+    settings = settings or {"points": GRAPH_POINTS}
+    width = x_max - x_min
+    x_min = settings.get('xMin', x_min)
+    x_max = settings.get('xMax', x_max)
+    # A lone bound past the default opposite edge keeps the default width
+    if 'xMin' not in settings and not x_min < x_max:
+        x_min = x_max - width
+    if 'xMax' not in settings and not x_min < x_max:
+        x_max = x_min + width
+    if not x_min < x_max:
+        raise ValueError("Graph viewport must have xMin < xMax")
+    y_range = None
+    if 'yMin' in settings and 'yMax' in settings:
+        y_range = (settings['yMin'], settings['yMax'])
+    return adaptive_sample(funcs, float(x_min), float(x_max), settings['points'], y_range)
+
+@timed("graph")
+def sample_expressions(exprs, var, x_min, x_max, settings=None):
+    """Compile expressions and sample them adaptively over the requested viewport."""
+    funcs = [compile_function(expr, var) for expr in exprs]
+    return sample_functions(funcs, x_min, x_max, settings)
+
+@timed("graph")
+def to_points(x_vals, y_vals, drop_undefined=False):
+    """Convert sampled arrays to graph points; undefined values become None."""
+    defined = np.isfinite(y_vals)
+    points = []
+    for x_val, y_val, ok in zip(x_vals.tolist(), y_vals.tolist(), defined.tolist()):
+        if ok:
+            points.append({"x": x_val, "y": y_val})
+        elif not drop_undefined:
+            points.append({"x": x_val, "y": None})
+    return points
+
+# Polynomial engine
+# Irreducible factors up to this degree are solved exactly, larger ones numerically
+EXACT_FACTOR_DEGREE = 4
+# Newton iterations used to polish numeric roots (0 disables refinement)
+POLY_NEWTON_STEPS = int(os.environ.get("POLY_NEWTON_STEPS", 2))
+
+def as_numeric_poly(expr, var):
+    """Return expr as a Poly in var if it is a polynomial with numeric coefficients."""
+    try:
+        poly = Poly(expr, var)
+    except PolynomialError:
+        return None
+    if poly.domain.is_ZZ or poly.domain.is_QQ or poly.domain.is_RR:
+        return poly
+    return None
+
+def horner_function(poly):
+    """Return a vectorized Horner-scheme evaluator for a polynomial."""
+    coeffs = [float(coeff) for coeff in poly.all_coeffs()]
+
+    def evaluate(x_vals):
+        with np.errstate(all='ignore'):
+            y_vals = np.full(np.shape(x_vals), coeffs[0])
+            for coeff in coeffs[1:]:
+                y_vals = y_vals * x_vals + coeff
+        return np.where(np.isfinite(y_vals), y_vals, np.nan)
+
+    return evaluate
+
+def _closed_form_roots(poly):
+    """Roots of a polynomial of degree 1 or 2 from the closed-form formulas."""
+    coeffs = poly.all_coeffs()
+    if len(coeffs) == 2:
+        return [-coeffs[1] / coeffs[0]]
+    a_coeff, b_coeff, c_coeff = coeffs
+    discriminant = b_coeff**2 - 4*a_coeff*c_coeff
+    if discriminant == 0:
+        return [-b_coeff / (2*a_coeff)]
+    root = sqrt(discriminant)
+    return [(-b_coeff - root) / (2*a_coeff), (-b_coeff + root) / (2*a_coeff)]
+
+def _numeric_roots(poly):
+    """Roots of a polynomial from its companion matrix, polished with Newton steps."""
+    coeffs = np.array([complex(coeff) for coeff in poly.all_coeffs()])
+    found = np.roots(coeffs)
+    derivative = np.polyder(coeffs)
+    with np.errstate(all='ignore'):
+        for _ in range(POLY_NEWTON_STEPS):
+            slope = np.polyval(derivative, found)
+            step = np.where(slope != 0, np.polyval(coeffs, found) / slope, 0)
+            found = np.where(np.isfinite(step), found - step, found)
+
+    result = []
+    for value in found:
+        magnitude = max(1.0, abs(value))
+        # Repeated roots come back as tight clusters; keep one representative
+        if any(abs(value - complex(other)) < 1e-7 * magnitude for other in result):
+            continue
+        if abs(value.imag) < 1e-10 * magnitude:
+            result.append(Float(value.real, 15))
+        else:
+            result.append(Float(value.real, 15) + Float(value.imag, 15) * I)
+    return result
+
+def _root_sort_key(root):
+    """Order real roots first, then by real and imaginary part."""
+    value = complex(root.evalf())
+    return (value.imag != 0, value.real, value.imag)
+
+def polynomial_roots(poly):
+    """Return (roots, method) for a univariate polynomial with numeric coefficients.
+
+    Degree one and two use the closed forms. Exact coefficients are factored so
+    rational roots and low-degree factors stay exact, and only the remaining
+    high-degree factors go through numeric companion-matrix root finding.
+    """
+    degree = poly.degree()
+    if degree <= 0:
+        return [], "constant"
+    if degree <= 2:
+        return _closed_form_roots(poly), "closed form"
+
+    if poly.domain.is_RR:
+        # The companion matrix spreads a repeated root into a cluster too wide to
+        # merge, so split the polynomial into square-free factors first
+        found, method = [], "numeric"
+        for factor, _ in poly.set_domain(QQ).sqf_list()[1]:
+            if factor.degree() <= 2:
+                found.extend(root.evalf(15) for root in _closed_form_roots(factor))
+            else:
+                found.extend(_numeric_roots(factor))
+    else:
+        found, numeric = [], False
+        for factor, _ in poly.factor_list()[1]:
+            if factor.degree() <= 2:
+                found.extend(_closed_form_roots(factor))
+            elif factor.degree() <= EXACT_FACTOR_DEGREE:
+                found.extend(roots(factor, multiple=True))
+            else:
+                found.extend(_numeric_roots(factor))
+                numeric = True
+        method = "factorization and numeric" if numeric else "factorization"
+
+    unique = []
+    for root in found:
+        if root not in unique:
+            unique.append(root)
+    return sorted(unique, key=_root_sort_key), method
+
+# Linear systems
+# Systems with more unknowns than this are solved numerically with LAPACK
+EXACT_SYSTEM_SIZE = int(os.environ.get("EXACT_SYSTEM_SIZE", 12))
+
+_NUMBER = r'(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+_LINEAR_TERM = re.compile(rf'\s*((?:[+-]\s*)*)(?:({_NUMBER})\s*(?:\*\s*([A-Za-z_]\w*))?|([A-Za-z_]\w*))\s*')
+
+def _parse_number(text):
+    return int(text) if text.isdigit() else float(text)
+
+def parse_linear_side(text):
+    """Parse 'c1*x + c2*y - c3' into ({name: coeff}, constant) without SymPy.
+
+    Returns None for anything beyond plain sums of numeric multiples of names,
+    so the caller can fall back to the full expression parser.
+    """
+    coeffs = {}
+    constant = 0
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _LINEAR_TERM.match(text, pos)
+        if not match or match.end() == pos or (pos > 0 and not match.group(1)):
+            return None
+        sign = -1 if match.group(1).count('-') % 2 else 1
+        number, scaled_name, bare_name = match.group(2), match.group(3), match.group(4)
+        name = scaled_name or bare_name
+        value = sign * (_parse_number(number) if number else 1)
+        if name:
+            # Constants and functions are left to the full parser
+            if name in PARSER_NAMESPACE and not PARSER_NAMESPACE[name].is_Symbol:
+                return None
+            coeffs[name] = coeffs.get(name, 0) + value
+        else:
+            constant += value
+        pos = match.end()
+    return coeffs, constant
+
+@timed("parse")
+def parse_linear_equation(lhs, rhs):
+    """Return the row (coeffs, constant) of lhs - rhs = 0, or None if not plain linear text."""
+    left = parse_linear_side(lhs)
+    right = parse_linear_side(rhs)
+    if left is None or right is None or not (lhs.strip() and rhs.strip()):
+        return None
+    coeffs = dict(left[0])
+    for name, value in right[0].items():
+        coeffs[name] = coeffs.get(name, 0) - value
+    return {Symbol(name): value for name, value in coeffs.items()}, left[1] - right[1]
+
+def linear_row(expr):
+    """Return the row (coeffs, constant) of expr = 0 if expr is linear, else None."""
+    for candidate in (expr, expand(expr)):
+        terms = candidate.as_coefficients_dict()
+        if all(term == 1 or term.is_Symbol for term in terms):
+            coeffs = {term: coeff for term, coeff in terms.items() if term != 1}
+            return coeffs, terms.get(S.One, 0)
+    return None
+
+def variable_sort_key(var):
+    """Sort key that orders x2 before x10."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', str(var))]
+
+def solve_linear_system(rows, variables):
+    """Solve linear rows of coeffs·vars + constant = 0.
+
+    Returns (solution, steps). Small systems are solved exactly with SymPy's
+    sparse rational elimination; larger ones with NumPy/LAPACK in float64.
+    Both paths report the coefficient and augmented ranks so inconsistent and
+    underdetermined systems are called out explicitly.
+    """
+    index = {var: i for i, var in enumerate(variables)}
+    steps = [f"Linear system with {len(rows)} equation(s) in {len(variables)} unknown(s)"]
+
+    if len(variables) <= EXACT_SYSTEM_SIZE:
+        matrix = zeros(len(rows), len(variables))
+        vector = zeros(len(rows), 1)
+        for i, (coeffs, constant) in enumerate(rows):
+            for var, coeff in coeffs.items():
+                matrix[i, index[var]] = S(coeff)
+            vector[i, 0] = -S(constant)
+        rank = matrix.rank()
+        augmented_rank = matrix.row_join(vector).rank()
+        steps.append(f"Coefficient matrix rank {rank}, augmented matrix rank {augmented_rank}")
+        if rank < augmented_rank:
+            steps.append("The system is inconsistent")
+            return "No solution", steps
+
+        steps.append("Solving exactly by Gaussian elimination")
+        values = next(iter(linsolve((matrix, vector), variables)))
+        parts = [f"{var} = {val}" for var, val in zip(variables, values) if val != var]
+        if rank < len(variables):
+            steps.append(f"{len(variables) - rank} free variable(s), so there are infinitely many solutions")
+            return "Infinitely many solutions: " + ", ".join(parts), steps
+        return ", ".join(parts), steps
+
+    matrix = np.zeros((len(rows), len(variables)))
+    vector = np.zeros(len(rows))
+    for i, (coeffs, constant) in enumerate(rows):
+        for var, coeff in coeffs.items():
+            matrix[i, index[var]] = float(coeff)
+        vector[i] = -float(constant)
+    rank = np.linalg.matrix_rank(matrix)
+    augmented_rank = np.linalg.matrix_rank(np.column_stack([matrix, vector]))
+    steps.append(f"Coefficient matrix rank {rank}, augmented matrix rank {augmented_rank}")
+    if rank < augmented_rank:
+        steps.append("The system is inconsistent")
+        return "No solution", steps
+
+    if rank == len(variables) == len(rows):
+        steps.append("Solving numerically by LU factorization")
+        values = np.linalg.solve(matrix, vector)
+    else:
+        steps.append("Solving numerically by least squares")
+        values = np.linalg.lstsq(matrix, vector, rcond=None)[0]
+    parts = [f"{var} = {val:.12g}" for var, val in zip(variables, values)]
+    if rank < len(variables):
+        steps.append(f"{len(variables) - rank} free variable(s); showing the minimum-norm solution")
+        return "Infinitely many solutions, e.g. " + ", ".join(parts), steps
+    return ", ".join(parts), steps
+
+# Statistics engine
+STATISTICS_SUBTYPES = ("mean", "median", "mode", "standard_deviation", "variance", "range")
+STATISTICS_MAX_VALUES = int(os.environ.get("STATISTICS_MAX_VALUES", 10_000_000))
+STATISTICS_CHUNK = 1 << 16
+HISTOGRAM_BINS = 50
+# Datasets up to this size are still listed in full in the steps
+DATA_PREVIEW = 20
+
+class RunningStats:
+    """Single-pass count/mean/variance/min/max, merged chunk by chunk (Welford/Chan)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, chunk):
+        size = chunk.size
+        if size == 0:
+            return
+        with np.errstate(over='ignore', invalid='ignore'):
+            chunk_mean = float(chunk.mean())
+            if not math.isfinite(chunk_mean):
+                # The sum overflowed; the average of the scaled-down values cannot
+                chunk_mean = float((chunk / size).sum())
+            chunk_m2 = float(np.square(chunk - chunk_mean).sum())
+        total = self.count + size
+        delta = chunk_mean - self.mean
+        # Weighting both means keeps the mean finite where the delta overflows
+        self.mean = self.mean * (self.count / total) + chunk_mean * (size / total)
+        self.m2 += chunk_m2
+        if self.count:
+            self.m2 += delta * delta * self.count * size / total
+        self.count = total
+        self.min = min(self.min, float(chunk.min()))
+        self.max = max(self.max, float(chunk.max()))
+
+    @property
+    def variance(self):
+        # Population variance, as the statistics branch has always reported
+        return self.m2 / self.count if self.count else float('nan')
+
+@timed("parse")
+def parse_dataset(text):
+    """Parse 'data = [..]', a bare JSON array, or comma/whitespace separated values."""
+    if not isinstance(text, str):
+        raise ValueError("Invalid data format. Use: data = [x1, x2, ...]")
+    text = text.strip()
+    match = re.match(r'data\s*=', text)
+    if match:
+        text = text[match.end():].strip()
+
+    if text.startswith('['):
+        try:
+            values = json.loads(text)
+        except ValueError:
+            raise ValueError("Invalid data format. Use: data = [x1, x2, ...]")
+        if not isinstance(values, list):
+            raise ValueError("Data must be a list of numbers")
+        try:
+            data = np.asarray(values, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError("Data must be a list of numbers")
+    else:
+        tokens = [token for token in re.split(r'[\s,;]+', text) if token]
+        try:
+            data = np.array(tokens, dtype=float)
+        except ValueError:
+            raise ValueError("Invalid data format. Use: data = [x1, x2, ...]")
+    return _check_dataset(data)
+
+@timed("parse")
+def read_float64_stream(stream):
+    """Read a raw little-endian float64 body in chunks without building Python floats."""
+    chunks = []
+    pending = b''
+    total = 0
+    while True:
+        block = stream.read(STATISTICS_CHUNK * 8)
+        if not block:
+            break
+        block = pending + block
+        usable = len(block) - len(block) % 8
+        pending = block[usable:]
+        chunk = np.frombuffer(block[:usable], dtype='<f8')
+        total += chunk.size
+        if total > STATISTICS_MAX_VALUES:
+            raise ValueError(f"Data sets are limited to {STATISTICS_MAX_VALUES} values")
+        chunks.append(chunk)
+    if pending:
+        raise ValueError("Binary data must be a whole number of float64 values")
+    data = np.concatenate(chunks) if chunks else np.empty(0)
+    return _check_dataset(data)
+
+def _check_dataset(data):
+    if data.ndim != 1:
+        raise ValueError("Data must be a list of numbers")
+    if data.size == 0:
+        raise ValueError("Data set is empty")
+    if data.size > STATISTICS_MAX_VALUES:
+        raise ValueError(f"Data sets are limited to {STATISTICS_MAX_VALUES} values")
+    if not np.all(np.isfinite(data)):
+        raise ValueError("Data must contain only finite numbers")
+    return data
+
+def _stat_value(value, integral):
+    """Report values taken straight from an integer dataset as ints."""
+    value = float(value)
+    return int(value) if integral and value.is_integer() else value
+
+def _running_stats(data):
+    stats = RunningStats()
+    for start in range(0, data.size, STATISTICS_CHUNK):
+        stats.update(data[start:start + STATISTICS_CHUNK])
+    return stats
+
+def _float_scale(stats):
+    """Power of two that brings the data within [-2, 2]; dividing by it is exact."""
+    return math.ldexp(1.0, math.frexp(max(abs(stats.min), abs(stats.max)))[1] - 1)
+
+def _histogram(data, stats):
+    bins = max(1, min(HISTOGRAM_BINS, int(np.sqrt(data.size))))
+    # Near the float limits the span overflows, so bin scaled data and scale the
+    # edges back
+    scale = _float_scale(stats) if max(abs(stats.min), abs(stats.max)) > 2 ** 52 else 1.0
+    low, high = stats.min / scale, stats.max / scale
+    if low == high:
+        # Half a unit is lost in rounding at that size
+        pad = 0.5 if scale == 1 else abs(low) / 4
+        low, high = low - pad, high + pad
+    counts, edges = np.histogram(data / scale, bins=bins, range=(low, high))
+    with np.errstate(over='ignore'):
+        edges = np.clip(edges * scale, -sys.float_info.max, sys.float_info.max)
+    return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+def solve_statistics(data, sub_type, steps=None, output="numeric"):
+    """Summarize a float64 dataset and return a (response, status) tuple.
+
+    With output "exact", integer datasets get exact means, medians, variances
+    and standard deviations in the solution text.
+    """
+    steps = steps if steps is not None else StepLog()
+    if sub_type not in STATISTICS_SUBTYPES:
+        return {"error": f"Unsupported statistics sub-type: {sub_type}"}, 400
+
+    stats = _running_stats(data)
+    integral = bool(np.all(np.mod(data, 1) == 0))
+    exact = output == "exact" and integral
+    n = stats.count
+
+    steps.append(f"Statistical analysis: {sub_type}")
+    if steps.enabled and n <= DATA_PREVIEW:
+        steps.append(f"Data set: {[_stat_value(value, integral) for value in data.tolist()]}")
+    else:
+        steps.append(f"Data set: {n} values between {_stat_value(stats.min, integral)} and {_stat_value(stats.max, integral)}")
+
+    # Binned data rather than the raw points keeps the payload size fixed
+    graph_data = {
+        "type": "statistics",
+        "subType": sub_type,
+        "count": n,
+        "histogram": _histogram(data, stats)
+    }
+
+    if sub_type == "mean":
+        mean = stats.mean
+        steps.append(f"Calculate the mean: sum(data) / n")
+        if steps.enabled and n <= DATA_PREVIEW:
+            terms = ' + '.join(str(_stat_value(value, integral)) for value in data.tolist())
+            steps.append(f"Mean = ({terms}) / {n} = {mean}")
+        elif math.isfinite(mean * n):
+            steps.append(f"Mean = {mean * n} / {n} = {mean}")
+        else:
+            steps.append(f"Mean = sum(data) / {n} = {mean}")
+        solution = f"Mean = {_exact_statistic(data, sub_type) if exact else mean}"
+        graph_data["result"] = mean
+
+    elif sub_type == "median":
+        # Selection instead of a full sort: O(n) to place the middle element(s)
+        steps.append(f"Select the middle value(s) of the {n} data points")
+        if n % 2 == 0:
+            lower, upper = np.partition(data, [n//2 - 1, n//2])[[n//2 - 1, n//2]]
+            lower, upper = _stat_value(lower, integral), _stat_value(upper, integral)
+            # Halving first keeps the sum of two huge floats from overflowing
+            median = (lower + upper) / 2 if integral else lower / 2 + upper / 2
+            steps.append(f"For even number of elements, median = (data[n/2 - 1] + data[n/2]) / 2")
+            steps.append(f"Median = ({lower} + {upper}) / 2 = {median}")
+        else:
+            median = _stat_value(np.partition(data, n//2)[n//2], integral)
+            steps.append(f"For odd number of elements, median = data[n/2]")
+            steps.append(f"Median = {median}")
+        solution = f"Median = {_exact_statistic(data, sub_type) if exact else median}"
+        graph_data["result"] = median
+
+    elif sub_type == "mode":
+        counter = Counter(data.tolist())
+        top_count = max(counter.values())
+        if top_count > 1:  # Check if any value appears more than once
+            mode_values = [_stat_value(val, integral) for val, count in counter.items() if count == top_count]
+            steps.append(f"Find the value(s) that appear most frequently")
+            steps.append(f"Mode = {mode_values}")
+            solution = f"Mode = {mode_values}"
+            graph_data["result"] = mode_values
+        else:
+            steps.append("No value appears more than once")
+            solution = "No mode (all values appear exactly once)"
+            graph_data["result"] = "No mode"
+
+    elif sub_type == "standard_deviation":
+        variance = stats.variance
+        std_dev = variance ** 0.5
+        if not math.isfinite(variance):
+            # The variance overflows but the deviation itself may not
+            scale = _float_scale(stats)
+            std_dev = _running_stats(data / scale).variance ** 0.5 * scale
+        steps.append(f"Calculate the mean: {stats.mean}")
+        steps.append(f"Calculate the variance: sum((x - mean)² for each x in data) / n")
+        steps.append(f"Variance = {variance}")
+        steps.append(f"Standard deviation = √variance = {std_dev}")
+        solution = f"Standard Deviation = {_exact_statistic(data, sub_type) if exact else std_dev}"
+        graph_data["result"] = std_dev
+
+    elif sub_type == "variance":
+        variance = stats.variance
+        steps.append(f"Calculate the mean: {stats.mean}")
+        steps.append(f"Calculate the variance: sum((x - mean)² for each x in data) / n")
+        steps.append(f"Variance = {variance}")
+        solution = f"Variance = {_exact_statistic(data, sub_type) if exact else variance}"
+        graph_data["result"] = variance
+
+    elif sub_type == "range":
+        low, high = _stat_value(stats.min, integral), _stat_value(stats.max, integral)
+        data_range = high - low
+        steps.append(f"Find the minimum value: {low}")
+        steps.append(f"Find the maximum value: {high}")
+        steps.append(f"Calculate range = max - min = {high} - {low} = {data_range}")
+        solution = f"Range = {data_range}"
+        graph_data["result"] = data_range
+
+    # JSON has no inf or NaN; near the float limits a variance or range can overflow
+    if isinstance(graph_data["result"], float) and not math.isfinite(graph_data["result"]):
+        return {"error": f"The {sub_type.replace('_', ' ')} of this data set is too large to represent"}, 400
+    return {"solution": solution, "steps": steps.render(), "graph_data": graph_data}, 200
+
+# Parameter sets: many geometry shapes or statistics datasets in one vectorized pass
+MAX_PARAMETER_SETS = int(os.environ.get("MAX_PARAMETER_SETS", 100000))
+# "exact" keeps π symbolic in geometry and gives fractions for integer datasets
+OUTPUT_MODES = ("exact", "numeric")
+
+# sub-type: (parameters, formula on arrays, result is a multiple of π, label, formula text)
+GEOMETRY_FORMULAS = {
+    "circle_area": (("radius",), lambda r: r**2, True, "Area", "Area of a circle: A = π × r²"),
+    "circle_circumference": (("radius",), lambda r: 2 * r, True, "Circumference",
+                             "Circumference of a circle: C = 2π × r"),
+    "triangle_area": (("base", "height"), lambda b, h: (b * h) / 2, False, "Area",
+                      "Area of a triangle: A = (b × h) / 2"),
+    "rectangle_area": (("length", "width"), lambda l, w: l * w, False, "Area", "Area of a rectangle: A = l × w"),
+    "sphere_volume": (("radius",), lambda r: (4/3) * r**3, True, "Volume", "Volume of a sphere: V = (4/3) × π × r³")
+}
+
+def parameter_columns(parameter_sets, names):
+    """Turn a list of {name: value} objects, or an object of equal-length lists, into float arrays."""
+    if isinstance(parameter_sets, dict):
+        columns = {name: parameter_sets.get(name) for name in names}
+        if not all(isinstance(values, list) for values in columns.values()):
+            raise ValueError(f"parameterSets needs a list of values for each of: {', '.join(names)}")
+    elif isinstance(parameter_sets, list) and all(isinstance(item, dict) for item in parameter_sets):
+        columns = {name: [item.get(name) for item in parameter_sets] for name in names}
+    else:
+        raise ValueError("parameterSets must be a list of objects or an object of lists")
+
+    arrays = []
+    for name, values in columns.items():
+        try:
+            # Missing values (None) become NaN and are rejected below
+            array = np.asarray(values, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError(f"Every {name} must be a number")
+        if array.ndim != 1 or not np.all(np.isfinite(array)):
+            raise ValueError(f"Every parameter set needs a finite {name}")
+        arrays.append(array)
+    if len({array.size for array in arrays}) > 1:
+        raise ValueError("Every parameter list must have the same length")
+    if arrays[0].size == 0:
+        raise ValueError("parameterSets is empty")
+    if arrays[0].size > MAX_PARAMETER_SETS:
+        raise ValueError(f"parameterSets is limited to {MAX_PARAMETER_SETS} entries")
+    return arrays
+
+def _finite_list(values):
+    """Float results as a list, with overflowed values as None (JSON has no inf or NaN)."""
+    return [value if math.isfinite(value) else None for value in np.asarray(values, dtype=float).tolist()]
+
+def solve_geometry_batch(sub_type, parameter_sets, output, steps):
+    """Evaluate one geometry formula for every parameter set at once."""
+    if sub_type not in GEOMETRY_FORMULAS:
+        return {"error": "Unsupported geometry sub-type"}, 400
+    names, formula, pi_multiple, label, formula_text = GEOMETRY_FORMULAS[sub_type]
+    try:
+        columns = parameter_columns(parameter_sets, names)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    with np.errstate(all='ignore'):
+        values = formula(*columns)
+        if pi_multiple and output == "numeric":
+            values = values * np.pi
+    results = _finite_list(values)
+    if pi_multiple and output == "exact":
+        results = [None if value is None else f"{value!r}*pi" for value in results]
+
+    steps.append(f"Geometry problem type: {sub_type}")
+    steps.append(formula_text)
+    steps.append(f"Apply the formula to all {len(results)} parameter sets at once")
+    return {
+        "solution": f"{label} computed for {len(results)} parameter sets",
+        "steps": steps.render(),
+        "results": results
+    }, 200
+
+def _dataset_arrays(datasets):
+    if not isinstance(datasets, list) or not datasets:
+        raise ValueError("parameterSets must be a non-empty list of datasets")
+    if len(datasets) > MAX_PARAMETER_SETS:
+        raise ValueError(f"parameterSets is limited to {MAX_PARAMETER_SETS} entries")
+    arrays = []
+    for dataset in datasets:
+        try:
+            arrays.append(_check_dataset(np.asarray(dataset, dtype=float)))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Dataset {len(arrays) + 1}: {e}" if str(e) else f"Dataset {len(arrays) + 1} is invalid")
+    if sum(array.size for array in arrays) > STATISTICS_MAX_VALUES:
+        raise ValueError(f"Datasets are limited to {STATISTICS_MAX_VALUES} values in total")
+    return arrays
+
+def _exact_statistic(data, sub_type):
+    """Exact statistic of an integer dataset as text: fractions, and a surd for the deviation."""
+    values = sorted(int(value) for value in data.tolist())
+    n = len(values)
+    total = sum(values)
+    if sub_type == "mean":
+        return str(Rational(total, n))
+    if sub_type == "median":
+        return str(Rational(values[(n - 1) // 2] + values[n // 2], 2))
+    variance = Rational(n * sum(value * value for value in values) - total * total, n * n)
+    return str(variance if sub_type == "variance" else sqrt(variance))
+
+def solve_statistics_batch(datasets, sub_type, output, steps):
+    """Compute one statistic for many datasets in a single pass over their concatenation."""
+    if sub_type not in STATISTICS_SUBTYPES:
+        return {"error": f"Unsupported statistics sub-type: {sub_type}"}, 400
+    try:
+        arrays = _dataset_arrays(datasets)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    lengths = np.array([array.size for array in arrays])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    values = np.concatenate(arrays)
+    segments = np.repeat(np.arange(len(arrays)), lengths)
+    integral = np.minimum.reduceat((np.mod(values, 1) == 0).astype(np.int8), starts).astype(bool)
+
+    with np.errstate(all='ignore'):
+        if sub_type in ("mean", "variance", "standard_deviation"):
+            means = np.add.reduceat(values, starts) / lengths
+            overflowed = ~np.isfinite(means)
+            if overflowed.any():
+                # Averaging scaled-down values cannot overflow
+                means[overflowed] = np.add.reduceat(values / np.repeat(lengths, lengths), starts)[overflowed]
+            result = means
+            if sub_type != "mean":
+                result = np.add.reduceat((values - np.repeat(means, lengths)) ** 2, starts) / lengths
+                if sub_type == "standard_deviation":
+                    result = np.sqrt(result)
+        elif sub_type == "range":
+            result = np.maximum.reduceat(values, starts) - np.minimum.reduceat(values, starts)
+        else:
+            # Sorting by (dataset, value) puts every dataset's values in order, one after another
+            ordered = values[np.lexsort((values, segments))]
+            if sub_type == "median":
+                result = (ordered[starts + (lengths - 1) // 2] + ordered[starts + lengths // 2]) / 2
+            else:
+                new_run = np.concatenate([[True], (ordered[1:] != ordered[:-1]) | (segments[1:] != segments[:-1])])
+                run_starts = np.flatnonzero(new_run)
+                run_lengths = np.diff(np.append(run_starts, ordered.size))
+                run_segments = segments[run_starts]
+                first_runs = np.flatnonzero(np.concatenate([[True], run_segments[1:] != run_segments[:-1]]))
+                top = np.repeat(np.maximum.reduceat(run_lengths, first_runs),
+                                np.diff(np.append(first_runs, run_starts.size)))
+                is_mode = (run_lengths == top) & (top > 1)
+                modes = [[] for _ in arrays]
+                for segment, value in zip(run_segments[is_mode].tolist(), ordered[run_starts[is_mode]].tolist()):
+                    modes[segment].append(_stat_value(value, integral[segment]))
+                result = [found or "No mode" for found in modes]
+
+    if sub_type != "mode":
+        result = _finite_list(result)
+        if sub_type in ("median", "range"):
+            result = [value if value is None else _stat_value(value, flag)
+                      for value, flag in zip(result, integral.tolist())]
+        if output == "exact" and sub_type != "range":
+            result = [_exact_statistic(array, sub_type) if flag else value
+                      for array, value, flag in zip(arrays, result, integral.tolist())]
+
+    steps.append(f"Statistical analysis: {sub_type}")
+    steps.append(f"Compute all {len(arrays)} datasets ({int(lengths.sum())} values) in one pass")
+    return {
+        "solution": f"{sub_type.replace('_', ' ').capitalize()} computed for {len(arrays)} datasets",
+        "steps": steps.render(),
+        "results": result
+    }, 200
+
+# Tiered integration: exact cheap methods first, the general algorithm last and under a deadline
+INTEGRATION_DEADLINE = float(os.environ.get("INTEGRATION_DEADLINE", 8))
+# Numeric definite integrals whose error estimate exceeds this, relative to the value, are rejected
+QUADRATURE_TOLERANCE = 1e-8
+# Most breakpoints (jumps and kinks) the numeric tier splits an integral at
+MAX_QUADRATURE_POINTS = 1000
+
+# How each tier is described in the steps; "numeric" only applies to definite integrals
+INTEGRATION_METHODS = {
+    "polynomial": "Integrate term by term with the power rule",
+    "table": "Integrate each term using the table of standard integrals",
+    "rational": "Integrate the rational function by partial fractions",
+    "full": "Integrate with the general integration algorithm",
+    "numeric": "No closed form was found in time; evaluate numerically with adaptive quadrature"
+}
+
+class DeadlineExceeded(Exception):
+    """Raised inside a deadline() block that runs out of time."""
+
+@contextmanager
+def deadline(seconds):
+    """Interrupt the block with DeadlineExceeded after `seconds`.
+
+    This relies on SIGALRM, so it only applies in a process's main thread, which is
+    where the solver workers run tasks. Elsewhere the block runs unbounded and only
+    the caller's own timeout applies.
+    """
+    if (not seconds or not hasattr(signal, "setitimer")
+            or threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise DeadlineExceeded()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+# Antiderivatives of f(u) for u linear in the variable, before dividing by u's slope
+_INTEGRAL_TABLE = {
+    sin: lambda u: -cos(u),
+    cos: sin,
+    tan: lambda u: -log(cos(u)),
+    cot: lambda u: log(sin(u)),
+    sec: lambda u: log(sec(u) + tan(u)),
+    csc: lambda u: -log(csc(u) + cot(u)),
+    exp: exp,
+    sinh: cosh,
+    cosh: sinh,
+    tanh: lambda u: log(cosh(u)),
+    log: lambda u: u*log(u) - u
+}
+
+def _linear_slope(arg, var):
+    """Return the slope of arg if it is linear in var, else None."""
+    slope = diff(arg, var)
+    return slope if slope != 0 and not slope.has(var) else None
+
+def _table_integral(term, var):
+    """Antiderivative of one term from the standard forms, or None if it has no entry."""
+    coeff, f = term.as_independent(var, as_Add=False)
+    if f.is_polynomial(var):
+        return coeff * Poly(f, var).integrate().as_expr()
+    if f.func in _INTEGRAL_TABLE and len(f.args) == 1:
+        slope = _linear_slope(f.args[0], var)
+        if slope is not None:
+            return coeff * _INTEGRAL_TABLE[f.func](f.args[0]) / slope
+    if not f.is_Pow:
+        return None
+
+    base, power = f.args
+    if not base.has(var):
+        # c**u
+        slope = _linear_slope(power, var)
+        return coeff * f / (slope * log(base)) if slope is not None else None
+    if power.has(var):
+        return None
+    slope = _linear_slope(base, var)
+    if slope is not None:
+        if power == -1:
+            return coeff * log(base) / slope
+        if not power.is_number:
+            # A symbolic exponent may still be -1
+            return coeff * Piecewise((base**(power + 1) / ((power + 1) * slope), Ne(power, -1)),
+                                     (log(base) / slope, True))
+        return coeff * base**(power + 1) / ((power + 1) * slope)
+    if len(base.args) == 1 and _linear_slope(base.args[0], var) is not None:
+        u = base.args[0]
+        squares = {(sec, 2): tan(u), (cos, -2): tan(u), (csc, 2): -cot(u), (sin, -2): -cot(u)}
+        if (base.func, power) in squares:
+            return coeff * squares[(base.func, power)] / _linear_slope(u, var)
+    if base.is_polynomial(var) and power in (-1, Rational(-1, 2)):
+        # 1/(p*x**2 + q) and 1/sqrt(q - p*x**2)
+        poly = Poly(base, var)
+        if poly.degree() == 2 and poly.coeff_monomial(var) == 0:
+            p, q = poly.coeff_monomial(var**2), poly.coeff_monomial(1)
+            if power == -1 and p.is_positive and q.is_positive:
+                return coeff * atan(sqrt(p / q) * var) / sqrt(p * q)
+            if power == Rational(-1, 2) and p.is_negative and q.is_positive:
+                return coeff * asin(sqrt(-p / q) * var) / sqrt(-p)
+    return None
+
+def integrate_tiered(expr, var):
+    """Return (antiderivative, tier), trying the cheap tiers before the general algorithm.
+
+    Returns (None, None) when the general algorithm runs out of time. An answer
+    from the "full" tier may still contain an unevaluated Integral.
+    """
+    if expr.is_polynomial(var):
+        return Poly(expr, var).integrate().as_expr(), "polynomial"
+    terms = [_table_integral(term, var) for term in Add.make_args(expr)]
+    if all(term is not None for term in terms):
+        return Add(*terms), "table"
+
+    # integrate() already falls back to manual rules and Risch-Norman, and does
+    # so faster than calling them up front, so they are left to the last tier
+    try:
+        with deadline(INTEGRATION_DEADLINE):
+            if expr.is_rational_function(var):
+                return ratint(expr, var), "rational"
+            return integrate(expr, var), "full"
+    except DeadlineExceeded:
+        return None, None
+
+def definite_integral(expr, var, lower, upper):
+    """Return (value, tier) for the integral of expr from lower to upper.
+
+    Without singularities between finite bounds the tiered antiderivative is
+    evaluated at the bounds; otherwise the general algorithm tries the definite
+    integral under the deadline. If neither finds a closed form, the "numeric"
+    tier integrates with mpmath quadrature, split at any known singularities and,
+    between finite bounds, at the jumps and kinks of Abs, sign, floor and ceiling.
+    The value is None when the integral diverges (an infinite or undefined result);
+    a ValueError is raised when quadrature cannot reach QUADRATURE_TOLERANCE.
+    """
+    try:
+        poles = singularities(expr, var, Interval(Min(lower, upper), Max(lower, upper)))
+        poles = sorted(poles, reverse=bool(lower > upper)) if poles.is_FiniteSet else None
+    except Exception:
+        poles = None
+
+    if poles == [] and lower.is_finite and upper.is_finite:
+        antiderivative, tier = integrate_tiered(expr, var)
+        if antiderivative is not None and not antiderivative.has(Integral):
+            return antiderivative.subs(var, upper) - antiderivative.subs(var, lower), tier
+    else:
+        try:
+            with deadline(INTEGRATION_DEADLINE):
+                value = integrate(expr, (var, lower, upper))
+            if not value.has(Integral):
+                return (value if _converges(value) else None), "full"
+        except DeadlineExceeded:
+            pass
+
+    func = lambdify(var, expr, modules="mpmath")
+    inner = [float(point) for point in poles or []]
+    if lower.is_finite and upper.is_finite:
+        inner.extend(_breakpoints(expr, var, float(Min(lower, upper)), float(Max(lower, upper))))
+    inner = sorted(set(inner), reverse=bool(lower > upper))
+    if len(inner) > MAX_QUADRATURE_POINTS:
+        raise ValueError(f"The integrand has more than {MAX_QUADRATURE_POINTS} jumps or kinks in the interval")
+    value, error = mpmath.quad(func, [float(lower), *inner, float(upper)], error=True)
+    if error > QUADRATURE_TOLERANCE * max(1.0, abs(value)):
+        raise ValueError(f"Numeric integration did not converge (error estimate {mpmath.nstr(error, 3)})")
+    if isinstance(value, mpmath.mpc):
+        value = value.real if abs(value.imag) < 1e-12 else value
+    value = S(value)
+    return (value if _converges(value) else None), "numeric"
+
+def _breakpoints(expr, var, low, high):
+    """Points in (low, high) where an Abs or sign argument changes sign or a floor or
+    ceiling argument crosses an integer, found on a grid and refined by bisection."""
+    xs = np.linspace(low, high, ROOT_SCAN_POINTS)
+    found = []
+    for node in expr.atoms(Abs, sign, floor, ceiling):
+        arg = compile_function(node.args[0], var)
+        values = arg(xs)
+        levels = np.floor(values) if node.func in (floor, ceiling) else np.sign(values)
+        brackets = np.nonzero(np.isfinite(values[:-1]) & np.isfinite(values[1:]) & (levels[:-1] != levels[1:]))[0]
+        if len(brackets) > MAX_QUADRATURE_POINTS:
+            raise ValueError(f"The integrand has more than {MAX_QUADRATURE_POINTS} jumps or kinks in the interval")
+        # The level crossed: zero for Abs and sign, the integer between the two ends otherwise
+        targets = (np.floor(np.maximum(values[brackets], values[brackets + 1]))
+                   if node.func in (floor, ceiling) else np.zeros(len(brackets)))
+        shifted = lambda t, targets=targets, arg=arg: arg(t) - targets
+        a, b = xs[brackets], xs[brackets + 1]
+        found.extend(_bisect(shifted, a, b, shifted(a)).tolist())
+    return [point for point in found if low < point < high]
+
+def _converges(value):
+    return not value.has(S.NaN, zoo) and value.is_finite is not False
+
+# Numeric root finding for equations that symbolic solving handles slowly or not at all
+ROOT_SCAN_POINTS = int(os.environ.get("ROOT_SCAN_POINTS", 4001))
+MAX_ROOT_SCAN_POINTS = 200000
+ROOT_REFINE_ITERATIONS = 60
+# A refined root must bring |f| below this fraction of the function's typical magnitude
+ROOT_TOLERANCE = 1e-8
+MAX_REPORTED_ROOTS = 50
+# Roots closer than this, relative to their size, are one root found twice
+ROOT_MERGE_TOLERANCE = 1e-7
+# Symbolic solving is only tried on small periodic equations, and only for this long
+TRIG_SYMBOLIC_SECONDS = float(os.environ.get("TRIG_SYMBOLIC_SECONDS", 0.5))
+TRIG_SYMBOLIC_MAX_OPS = 40
+TRIG_INTERVAL = (-2 * pi, 2 * pi)
+
+def find_real_roots(expr, var, low, high, points=ROOT_SCAN_POINTS):
+    """Return the sorted real roots of expr in [low, high] as a NumPy array.
+
+    Sign changes on a uniform grid are refined by bisection, all brackets at
+    once; roots where the function touches zero without crossing are found by
+    refining local minima of |expr|. Sign changes across poles are discarded
+    because |expr| does not shrink there. Roots closer together than the grid
+    spacing can be missed.
+    """
+    func = compile_function(expr, var)
+    xs = np.linspace(low, high, points)
+    ys = func(xs)
+    finite = np.isfinite(ys)
+    scale = max(1.0, float(np.percentile(np.abs(ys[finite]), 95))) if finite.any() else 1.0
+
+    left, right = ys[:-1], ys[1:]
+    brackets = np.nonzero(finite[:-1] & finite[1:] & (np.sign(left) * np.sign(right) < 0))[0]
+    crossings = _bisect(func, xs[brackets], xs[brackets + 1], left[brackets])
+
+    magnitude = np.abs(ys)
+    minima = np.nonzero(finite[:-2] & finite[1:-1] & finite[2:] & (ys[1:-1] != 0)
+                        & (magnitude[1:-1] <= magnitude[:-2]) & (magnitude[1:-1] < magnitude[2:])
+                        & (np.sign(ys[:-2]) == np.sign(ys[2:])))[0] + 1
+    a, b = xs[minima - 1], xs[minima + 1]
+    for _ in range(ROOT_REFINE_ITERATIONS):
+        # Golden-section search on |f|
+        m1, m2 = a + (b - a) * 0.381966, a + (b - a) * 0.618034
+        closer = np.abs(func(m1)) < np.abs(func(m2))
+        a, b = np.where(closer, a, m1), np.where(closer, m2, b)
+    touches = (a + b) / 2
+    if len(minima):
+        # Function values only place a touch point to about sqrt(eps); the sign
+        # change of the derivative there pins it down to full precision
+        slope = compile_function(diff(expr, var), var)
+        a, b = xs[minima - 1], xs[minima + 1]
+        slope_a, slope_b = slope(a), slope(b)
+        bracketed = np.isfinite(slope_a) & np.isfinite(slope_b) & (np.sign(slope_a) * np.sign(slope_b) < 0)
+        touches = np.where(bracketed, _bisect(slope, a, b, slope_a), touches)
+
+    # The interval ends can be roots that neither test above sees
+    candidates = np.concatenate([xs[finite & (ys == 0)], xs[[0, -1]], crossings, touches])
+    with np.errstate(all='ignore'):
+        residual = np.abs(func(candidates))
+    keep = residual <= ROOT_TOLERANCE * scale
+    candidates, residual = candidates[keep], residual[keep]
+    order = np.argsort(candidates)
+    roots = []
+    for root, error in zip(candidates[order].tolist(), residual[order].tolist()):
+        # One root found by several tests: keep the candidate with the smallest residual
+        if roots and root - roots[-1][0] <= ROOT_MERGE_TOLERANCE * max(1.0, abs(root)):
+            if error < roots[-1][1]:
+                roots[-1] = (root, error)
+            continue
+        roots.append((root, error))
+    return np.array([root for root, _ in roots])
+
+def _bisect(func, a, b, fa):
+    """Refine sign-change brackets [a, b] of func (fa = func(a)) by bisection, all at once."""
+    for _ in range(ROOT_REFINE_ITERATIONS):
+        mid = (a + b) / 2
+        f_mid = func(mid)
+        same = np.sign(f_mid) == np.sign(fa)
+        a, fa = np.where(same, mid, a), np.where(same, f_mid, fa)
+        b = np.where(same, b, mid)
+    return (a + b) / 2
+
+def parse_interval(value, name, allow_infinite=False):
+    """Validate a [lower, upper] request field into a pair of SymPy numbers, or None."""
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{name} must be a [lower, upper] pair")
+    parsed = []
+    for bound in value:
+        bound_expr = parse_math(str(bound).strip())
+        if bound_expr.free_symbols or not (bound_expr.is_finite and bound_expr.is_extended_real
+                                           or allow_infinite and bound_expr in (oo, -oo)):
+            allowed = "a real number, oo or -oo" if allow_infinite else "a finite real number"
+            raise ValueError(f"{name} bound {bound} must be {allowed}")
+        parsed.append(bound_expr)
+    return tuple(parsed)
+
+def _match_exact(root, exact_roots, period):
+    """Return the exact root (shifted by whole periods) equal to a numeric root, or None."""
+    for exact in exact_roots:
+        shift = 0
+        if period is not None:
+            shift = round((root - float(exact)) / float(period))
+        if abs(float(exact) + shift * float(period or 0) - root) < 1e-9 * max(1.0, abs(root)):
+            return exact + shift * period if shift else exact
+    return None
+
+def _format_root(root, exact_roots, period):
+    exact = _match_exact(root, exact_roots, period)
+    return str(exact) if exact is not None else f"{root:.10g}"
+
+# Limits: substitution and leading terms first, then a numeric probe, then Gruntz under a deadline
+LIMIT_SERIES_SECONDS = float(os.environ.get("LIMIT_SERIES_SECONDS", 1))
+LIMIT_DEADLINE = float(os.environ.get("LIMIT_DEADLINE", 6))
+LIMIT_DIRECTIONS = ("+-", "+", "-")
+# Functions that can jump, so plugging in the point does not give the limit
+_DISCONTINUOUS = (floor, ceiling, sign)
+# Converged probe values may spread by at most this, relative to their size
+LIMIT_PROBE_TOLERANCE = 1e-5
+LIMIT_DIVERGENCE = 1e8
+
+LIMIT_METHODS = {
+    "substitution": "The expression is continuous there, so substitute the point directly",
+    "series": "Read the limit off the leading term of the series expansion at the point",
+    "gruntz": "Evaluate with the Gruntz algorithm",
+    "numeric": "Estimate numerically from values ever closer to the point"
+}
+
+def _approach(var, point, side, h):
+    """Substitution for var that approaches point from side as the positive h goes to 0."""
+    if point is oo:
+        return 1 / h
+    if point is -oo:
+        return -1 / h
+    return point + h if side == "+" else point - h
+
+def _settled(value):
+    """Whether a value is a single finite number rather than a bound set or an undefined result."""
+    return bool(value.is_finite) and not value.has(S.NaN, zoo, AccumBounds)
+
+def _leading_term_limit(expr, var, point, side):
+    """One-sided limit read off the leading term of expr near the point, or None."""
+    h = Dummy('h', positive=True)
+    coeff, exponent = expr.subs(var, _approach(var, point, side, h)).leadterm(h)
+    if coeff.has(h, S.NaN, zoo, AccumBounds) or not exponent.is_real:
+        return None
+    if exponent.is_positive:
+        return S.Zero
+    if exponent.is_zero:
+        return coeff
+    if coeff.is_extended_real and coeff.is_nonzero:
+        return oo if coeff.is_positive else -oo
+    return None
+
+def probe_limit(expr, var, point, side):
+    """Estimate a one-sided limit from samples ever closer to the point.
+
+    Returns a float, oo or -oo, or None when the samples neither settle nor
+    blow up (oscillation, or too few defined points).
+    """
+    func = compile_function(expr, var)
+    if point in (oo, -oo):
+        xs = np.logspace(1, 8, 15) * (1.0 if point is oo else -1.0)
+    else:
+        steps = np.logspace(-1, -7, 13)
+        xs = float(point) + (steps if side == "+" else -steps)
+    ys = func(xs)
+    tail = ys[np.isfinite(ys)][-4:]
+    if len(tail) < 4:
+        return None
+    if np.ptp(tail) <= LIMIT_PROBE_TOLERANCE * max(1.0, abs(tail[-1])):
+        return float(tail[-1])
+    growing = np.all(np.diff(np.abs(tail)) > 0) and abs(tail[-1]) > LIMIT_DIVERGENCE
+    if growing and np.all(np.sign(tail) == np.sign(tail[-1])):
+        return oo if tail[-1] > 0 else -oo
+    return None
+
+def _same_limit(left, right):
+    if isinstance(left, float) or isinstance(right, float):
+        if left in (oo, -oo) or right in (oo, -oo):
+            return left == right
+        return abs(float(left) - float(right)) <= 1e-3 * max(1.0, abs(float(left)))
+    return left == right
+
+def evaluate_limit(expr, var, point, direction="+-"):
+    """Return (value, method, confident, sides) for the limit of expr at point.
+
+    value is None when the limit does not exist: sides then maps "+" and "-" to
+    one-sided limits that differ, or is empty when the expression oscillates. confident is False when the answer rests on the numeric
+    probe alone: either its one-sided estimates clearly disagree, or Gruntz
+    ran out of time and the agreeing estimate is all there is.
+    """
+    sides = ("+",) if point in (oo, -oo) else ("+", "-") if direction == "+-" else (direction,)
+
+    if point.is_finite and not expr.has(*_DISCONTINUOUS):
+        value = expr.subs(var, point)
+        # A pole inside, as in atan(1/x), can be absorbed into a finite-looking bound set
+        if _settled(value) and all(_settled(node.subs(var, point)) for node in expr.atoms(Pow, Function)):
+            return value, "substitution", True, {}
+
+    try:
+        with deadline(LIMIT_SERIES_SECONDS):
+            found = {side: _leading_term_limit(expr, var, point, side) for side in sides}
+        if all(value is not None for value in found.values()):
+            values = list(found.values())
+            if all(value == values[0] for value in values):
+                return values[0], "series", True, {}
+            return None, "series", True, found
+    except Exception:
+        # Essential singularities and logarithms need the heavier tiers
+        pass
+
+    # The probe is cheap, and one-sided limits that clearly differ settle the answer
+    estimates = {side: probe_limit(expr, var, point, side) for side in sides}
+    if len(sides) == 2 and None not in estimates.values() and not _same_limit(estimates["+"], estimates["-"]):
+        return None, "numeric", False, estimates
+
+    try:
+        with deadline(LIMIT_DEADLINE):
+            try:
+                value = sympy_limit(expr, var, point, direction if len(sides) == 2 else sides[0])
+                if value.has(AccumBounds, S.NaN, zoo):
+                    # Oscillates within bounds (sin(1/x) at 0) without settling
+                    return None, "gruntz", True, {}
+                return value, "gruntz", True, {}
+            except ValueError:
+                # Raised by two-sided limits whose sides differ
+                found = {side: sympy_limit(expr, var, point, side) for side in sides}
+                return None, "gruntz", True, found
+    except DeadlineExceeded:
+        values = list(estimates.values())
+        if None in values or not all(_same_limit(value, values[0]) for value in values):
+            return None, None, False, {}
+        return (values[0] if values[0] in (oo, -oo) else Float(values[0], 10)), "numeric", False, {}
+
+# Inequalities: polynomial and rational ones by root isolation and a sign chart
+INEQUALITY_OPERATORS = ('<=', '>=', '<', '>')
+# Isolating intervals are refined to this width before boundaries are reported
+ROOT_ISOLATION_WIDTH = Rational(1, 10**12)
+
+def split_inequality(expression):
+    """Split 'lhs op rhs' into (lhs, op, rhs) strings, or None if it is not one inequality."""
+    parts = re.split(r'(<=|>=|<|>)', expression)
+    if len(parts) != 3 or not parts[0].strip() or not parts[2].strip():
+        return None
+    return parts[0].strip(), parts[1], parts[2].strip()
+
+def _exact_boundary(factor, index_in_factor):
+    """Exact form of a root of a degree 1 or 2 factor, by its position among the real roots."""
+    real_roots = sorted((root for root in _closed_form_roots(factor) if root.is_real), key=float)
+    return real_roots[index_in_factor] if index_in_factor < len(real_roots) else None
+
+def sign_chart(numerator, denominator):
+    """Sign chart of numerator/denominator, both Polys over QQ.
+
+    Returns (points, signs): points lists the real zeros and poles in order as
+    dicts with the exact or certified value and its kind, and signs[i] is the
+    sign (+1, -1, or 0 for a zero numerator) on the open interval before points[i] (the last entry is
+    for the interval after the last point). Roots are isolated exactly, so the
+    signs are certified even where the reported value is a decimal.
+    """
+    factors = [(factor, "zero") for factor, _ in numerator.factor_list()[1]]
+    factors += [(factor, "pole") for factor, _ in denominator.factor_list()[1]]
+    isolated = intervals([factor for factor, _ in factors], eps=ROOT_ISOLATION_WIDTH) if factors else []
+    isolated.sort(key=lambda item: item[0][0])
+
+    seen = Counter()
+    points = []
+    for (low, high), owners in isolated:
+        kinds = {factors[index][1] for index in owners}
+        index = min(owners)
+        factor = factors[index][0]
+        value = None
+        if low == high:
+            value = low
+        elif factor.degree() <= 2:
+            value = _exact_boundary(factor, seen[index])
+        seen.update(owners)
+        points.append({
+            "value": value if value is not None else Float((low + high) / 2, 15),
+            "exact": value is not None,
+            "kind": "pole" if "pole" in kinds else "zero",
+            "isolation": (low, high)
+        })
+
+    # One rational test point inside each gap between isolating intervals
+    tests = []
+    for i in range(len(points) + 1):
+        if not points:
+            tests.append(Integer(0))
+        elif i == 0:
+            tests.append(points[0]["isolation"][0] - 1)
+        elif i == len(points):
+            tests.append(points[-1]["isolation"][1] + 1)
+        else:
+            tests.append((points[i - 1]["isolation"][1] + points[i]["isolation"][0]) / 2)
+    signs = [int(sign(numerator.eval(test) * denominator.eval(test))) for test in tests]
+    return points, signs
+
+def solution_intervals(points, signs, op):
+    """Merge the sign chart into maximal intervals where 'f op 0' holds.
+
+    Returns a list of (lower, upper, lower_closed, upper_closed) with None for
+    an infinite end.
+    """
+    wanted = 1 if op in ('>', '>=') else -1
+    closed = op in ('<=', '>=')
+    pieces = []
+    for i, sign in enumerate(signs):
+        lower = points[i - 1]["value"] if i > 0 else None
+        upper = points[i]["value"] if i < len(points) else None
+        if sign == wanted or sign == 0 and closed:
+            pieces.append([lower, upper, False, False])
+        if i < len(points) and closed and points[i]["kind"] == "zero":
+            pieces.append([points[i]["value"], points[i]["value"], True, True])
+
+    merged = []
+    for piece in pieces:
+        if merged and merged[-1][1] is not None and merged[-1][1] == piece[0] and (merged[-1][3] or piece[2]):
+            merged[-1][1], merged[-1][3] = piece[1], piece[3]
+        else:
+            merged.append(piece)
+    return [tuple(piece) for piece in merged]
+
+def format_intervals(pieces):
+    """Interval notation for a union, like '(-∞, -2] ∪ (1, 3]'."""
+    if not pieces:
+        return "∅"
+    text = []
+    for lower, upper, lower_closed, upper_closed in pieces:
+        if lower is not None and lower == upper:
+            text.append(f"{{{_format_boundary(lower)}}}")
+            continue
+        left = "(-∞" if lower is None else ("[" if lower_closed else "(") + _format_boundary(lower)
+        right = "∞)" if upper is None else _format_boundary(upper) + ("]" if upper_closed else ")")
+        text.append(f"{left}, {right}")
+    return " ∪ ".join(text)
+
+def _format_boundary(value):
+    return f"{float(value):.12g}" if isinstance(value, Float) else str(value)
+
+# Identifies the solver build; it changes with the code, so no cached answer outlives a deploy
+with open(__file__, 'rb') as _source:
+    SOLVER_VERSION = os.environ.get("SOLVER_VERSION") or hashlib.sha256(_source.read()).hexdigest()[:12]
+SOLVER_BUILD_TIME = os.path.getmtime(__file__)
+
+# Result cache for /solve
+SOLVE_CACHE_SIZE = int(os.environ.get("SOLVE_CACHE_SIZE", 1024))
+SOLVE_CACHE_TTL = float(os.environ.get("SOLVE_CACHE_TTL", 0)) or None
+
+class ResultCache:
+    """Thread-safe LRU cache with optional TTL and hit/miss counters."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # Expired entries are dropped on access
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": self.hits / lookups if lookups else 0.0
+            }
+
+result_cache = ResultCache(SOLVE_CACHE_SIZE, SOLVE_CACHE_TTL)
+
+MAX_CACHED_EXPRESSION = int(os.environ.get("MAX_CACHED_EXPRESSION", 65536))
+
+# Bulk parameterSets requests with more values than this are neither cached nor given ETags
+MAX_CACHED_PARAMETER_VALUES = 4096
+
+def parameter_values(options):
+    """Rough count of the values in a parameterSets option, without serializing it."""
+    sets = (options or {}).get('parameterSets')
+    if isinstance(sets, dict):
+        sets = list(sets.values())
+    if not isinstance(sets, list):
+        return 0
+    return sum(len(item) if isinstance(item, (list, dict)) else 1 for item in sets)
+
+def canonical_expression(expr_str):
+    """Return a whitespace-insensitive canonical form of a single expression.
+
+    Keys are built in the request thread before any deadline applies, so the
+    input is never parsed here: parsing still evaluates function calls.
+    """
+    return re.sub(r'\s+', '', expr_str)
+
+def cache_key(problem_type, expression, sub_type, options=None):
+    """Build the result cache key for a /solve request."""
+    if problem_type in ("geometry", "statistics"):
+        parts = [re.sub(r'\s+', '', expression)]
+    elif problem_type == "limit":
+        match = re.match(r"limit\(\s*(\w+)\s*,\s*([^,]+)\s*,\s*(.+)\s*\)", expression.strip())
+        if match:
+            parts = [canonical_expression(part) for part in match.groups()]
+        else:
+            parts = [re.sub(r'\s+', '', expression)]
+    else:
+        parts = []
+        for eq_str in expression.split(';'):
+            for token in re.split(r'(<=|>=|<|>|=)', eq_str):
+                if token in ('<=', '>=', '<', '>', '='):
+                    parts.append(token)
+                else:
+                    parts.append(canonical_expression(token))
+            parts.append(';')
+    return (problem_type, sub_type or '', tuple(parts), json.dumps(options or {}, sort_keys=True))
+
+# Request metrics, exposed at /metrics in the Prometheus text format
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms keyed by (name, label pairs)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._kinds = {}
+        self._help = {}
+        self._values = {}
+
+    def describe(self, name, kind, text):
+        self._kinds[name] = kind
+        self._help[name] = text
+        self._values.setdefault(name, {})
+
+    def inc(self, name, labels=(), amount=1):
+        """Add to a counter or gauge."""
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        """Record one observation in a histogram."""
+        with self._lock:
+            series = self._values[name]
+            counts = series.get(labels)
+            if counts is None:
+                # One count per bucket plus +Inf, then the running sum
+                counts = series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, series in self._values.items():
+                kind = self._kinds[name]
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series.items():
+                    if kind != "histogram":
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ("+Inf",), value[:-1]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value[-1]}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("solver_requests_total", "counter", "Solve requests by problem type and HTTP status.")
+metrics.describe("solver_errors_total", "counter", "Solve requests that ended in an error status.")
+metrics.describe("solver_requests_in_flight", "gauge", "Solve requests currently being handled.")
+metrics.describe("solver_request_duration_seconds", "histogram", "End-to-end solve latency, cache hits included.")
+metrics.describe("solver_stage_duration_seconds", "histogram", "Time spent per solver stage (cache misses only).")
+
+def metric_labels(problem_type, sub_type):
+    """Label pairs for a problem; unknown names become "other" so user input cannot add series."""
+    if not isinstance(problem_type, str) or problem_type not in {entry["id"] for entry in PROBLEM_TYPES["types"]}:
+        return (("type", "other"), ("subType", ""))
+    subtypes = {entry["id"] for entry in PROBLEM_TYPES["subtypes"].get(problem_type, [])}
+    if sub_type and (not isinstance(sub_type, str) or sub_type not in subtypes):
+        sub_type = "other"
+    return (("type", problem_type), ("subType", sub_type or ""))
+
+def record_stages(problem_type, sub_type, stage_seconds):
+    labels = metric_labels(problem_type, sub_type)
+    for stage, seconds in stage_seconds.items():
+        metrics.observe("solver_stage_duration_seconds", labels + (("stage", stage),), seconds)
+
+@contextmanager
+def tracked_request(problem_type, sub_type):
+    """Count and time a solve; the caller stores the HTTP status in the yielded dict."""
+    labels = metric_labels(problem_type, sub_type)
+    outcome = {"status": 500}
+    metrics.inc("solver_requests_in_flight", labels)
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except SolverCancelled:
+        outcome["status"] = "cancelled"
+        raise
+    finally:
+        status = outcome["status"]
+        metrics.inc("solver_requests_in_flight", labels, -1)
+        metrics.inc("solver_requests_total", labels + (("status", str(status)),))
+        if status != 200:
+            metrics.inc("solver_errors_total", labels + (("status", str(status)),))
+        metrics.observe("solver_request_duration_seconds", labels, time.perf_counter() - start)
+
+def run_timed(func, *args):
+    """Call a solver function and return (response, status, stage seconds)."""
+    timings = StageTimings()
+    token = _stage_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response, status = func(*args)
+    finally:
+        _stage_timings.reset(token)
+    elapsed = time.perf_counter() - start
+    timings.seconds["solve"] = max(0.0, elapsed - sum(timings.seconds.values()))
+    return response, status, timings.seconds
+
+# Profiling and slow-request capture
+# On-demand cProfile breakdowns for /solve (X-Profile header or "profile": true)
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_ROWS = int(os.environ.get("PROFILE_ROWS", 30))
+# Solves slower than this many seconds are logged with sampled stacks (0 disables)
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 5))
+# Optional JSON Lines file the slow-request log is appended to
+SLOW_REQUEST_LOG = os.environ.get("SLOW_REQUEST_LOG", "")
+SLOW_LOG_SIZE = int(os.environ.get("SLOW_LOG_SIZE", 100))
+SLOW_SAMPLE_INTERVAL = 0.01
+SLOW_STACK_DEPTH = 30
+SLOW_STACKS = 20
+# Longer inputs are truncated in the slow-request log
+SLOW_LOG_EXPRESSION = 2000
+
+def _short_path(filename):
+    for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{_short_path(code.co_filename)}:{frame.f_lineno}({code.co_name})"
+
+class StackSampler:
+    """Samples the stacks of solves that run past a threshold, from a background thread.
+
+    Solves are registered with begin() and end() from the thread running them.
+    Nothing is sampled until a solve has been running for `threshold` seconds, so
+    fast requests cost only the bookkeeping. If `publish` is given it receives a
+    snapshot about once a second while a solve is slow, which lets a worker hand
+    its stacks to the parent before being killed at its deadline.
+    """
+
+    def __init__(self, threshold, interval=SLOW_SAMPLE_INTERVAL, publish=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.publish = publish
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = (time.monotonic(), Counter())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def end(self):
+        """Stop watching the calling thread and return its stack snapshot."""
+        with self._lock:
+            _, samples = self._active.pop(threading.get_ident(), (None, Counter()))
+            return self._snapshot(samples)
+
+    @staticmethod
+    def _snapshot(samples):
+        return [{"count": count, "stack": list(stack)} for stack, count in samples.most_common(SLOW_STACKS)]
+
+    def _run(self):
+        last_publish = 0.0
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            snapshots = []
+            with self._lock:
+                slow = [(thread_id, samples) for thread_id, (started, samples) in self._active.items()
+                        if now - started >= self.threshold]
+                if not slow:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in slow:
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None and len(stack) < SLOW_STACK_DEPTH:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    # Outermost frame first, keeping the innermost SLOW_STACK_DEPTH frames
+                    samples[tuple(reversed(stack))] += 1
+                if self.publish is not None and now - last_publish >= 1:
+                    last_publish = now
+                    snapshots = [self._snapshot(samples) for _, samples in slow]
+            for snapshot in snapshots:
+                try:
+                    self.publish(snapshot)
+                except Exception:
+                    pass
+
+stack_sampler = StackSampler(SLOW_REQUEST_SECONDS)
+
+class SlowRequestLog:
+    """Ring buffer of slow solves, optionally mirrored to a JSON Lines file."""
+
+    def __init__(self, size, path=None):
+        self.path = path
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            self._entries.append(entry)
+            if self.path:
+                try:
+                    with open(self.path, "a") as handle:
+                        handle.write(line + "\n")
+                except OSError:
+                    pass
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+slow_log = SlowRequestLog(SLOW_LOG_SIZE, SLOW_REQUEST_LOG or None)
+
+# cProfile hooks are per process on newer Pythons, so profiles never overlap
+_profile_lock = threading.Lock()
+
+def profile_rows(profiler, limit=PROFILE_ROWS):
+    """Return the top functions of a profile by cumulative time."""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{
+        "function": f"{_short_path(filename)}:{line}({name})",
+        "calls": calls,
+        "primitiveCalls": primitive_calls,
+        "totalTime": total_time,
+        "cumulativeTime": cumulative_time
+    } for (filename, line, name), (primitive_calls, calls, total_time, cumulative_time, _) in rows]
+
+def run_task(task, profile=False):
+    """Solve a (type, expression, subType, options) task in this process.
+
+    Returns (response, status, report). The report holds the stage timings, the
+    sampled stacks if the solve ran slow, and a cProfile breakdown if asked for.
+    """
+    report = {}
+    sampling = SLOW_REQUEST_SECONDS > 0
+    if sampling:
+        stack_sampler.begin()
+    try:
+        if profile:
+            with _profile_lock:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    response, status, report["stages"] = run_timed(compute_solution, *task)
+                finally:
+                    profiler.disable()
+            report["profile"] = profile_rows(profiler)
+        else:
+            response, status, report["stages"] = run_timed(compute_solution, *task)
+    finally:
+        if sampling:
+            stacks = stack_sampler.end()
+            if stacks:
+                report["stacks"] = stacks
+    return response, status, report
+
+def record_slow_request(task, status, seconds, report):
+    problem_type, expression, sub_type, options = task
+    expression = str(expression)
+    if len(expression) > SLOW_LOG_EXPRESSION:
+        expression = expression[:SLOW_LOG_EXPRESSION] + f"... ({len(expression)} characters)"
+    slow_log.record({
+        "time": time.time(),
+        "type": problem_type,
+        "subType": sub_type,
+        "expression": expression,
+        "options": options,
+        "status": status,
+        "seconds": seconds,
+        "stages": report.get("stages", {}),
+        "stacks": report.get("stacks", [])
+    })
+
+# Persistent result store shared by every process on the node. Opt-in: rows are served
+# as answers, so point it at a directory only the app can write (empty disables it)
+RESULT_STORE_PATH = os.environ.get("RESULT_STORE_PATH", "")
+RESULT_STORE_MAX_BYTES = int(os.environ.get("RESULT_STORE_MAX_BYTES", 256 * 1024 * 1024))
+RESULT_STORE_TTL = float(os.environ.get("RESULT_STORE_TTL", 7 * 24 * 3600)) or None
+# Eviction runs once every this many writes
+STORE_EVICT_EVERY = 64
+# Last-access times are only refreshed when older than this, to keep reads cheap
+STORE_TOUCH_INTERVAL = 3600
+
+class ResultStore:
+    """SQLite result store shared by all worker processes on a node.
+
+    Rows are keyed by a hash of the canonical cache key and tagged with the solver
+    version; rows written by other versions are never returned and are purged when
+    a process first opens the store. WAL mode lets readers and one writer work
+    concurrently. Store errors are counted and otherwise ignored, so a broken or
+    locked database only costs cache hits.
+    """
+
+    def __init__(self, path, version, max_bytes, ttl=None):
+        self.path = path
+        self.version = version
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._purged = False
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Create the file owner-only; SQLite gives its WAL files the same mode
+            os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            with self._lock:
+                if not self._purged:
+                    conn.execute("DELETE FROM results WHERE version != ?", (self.version,))
+                    self._purged = True
+            self._local.conn = conn
+        return conn
+
+    def _hash(self, key):
+        return hashlib.sha256(json.dumps([self.version, key]).encode()).hexdigest()
+
+    def get(self, key):
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT response, created, accessed FROM results WHERE key = ? AND version = ?",
+                               (self._hash(key), self.version)).fetchone()
+            now = time.time()
+            if row is None or (self.ttl and row[1] < now - self.ttl):
+                self.misses += 1
+                return None
+            if row[2] < now - STORE_TOUCH_INTERVAL:
+                conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, self._hash(key)))
+            self.hits += 1
+            return json.loads(row[0])
+        except (sqlite3.Error, OSError, ValueError):
+            self.errors += 1
+            return None
+
+    def put(self, key, response):
+        try:
+            body = json.dumps(response)
+            now = time.time()
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                         (self._hash(key), self.version, body, len(body), now, now))
+            with self._lock:
+                self._writes += 1
+                evict = self._writes % STORE_EVICT_EVERY == 0
+            if evict:
+                self.evict()
+        except (sqlite3.Error, OSError, TypeError, ValueError):
+            self.errors += 1
+
+    def evict(self):
+        """Drop expired rows, then least recently used ones until under 90% of max_bytes."""
+        conn = self._connect()
+        if self.ttl:
+            conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        excess = total - int(self.max_bytes * 0.9)
+        if total <= self.max_bytes or excess <= 0:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM results WHERE key = ?", victims)
+
+    def stats(self):
+        try:
+            rows, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        except (sqlite3.Error, OSError):
+            rows = size = None
+        return {"path": self.path, "version": self.version, "rows": rows, "bytes": size,
+                "maxBytes": self.max_bytes, "ttl": self.ttl, "hits": self.hits,
+                "misses": self.misses, "errors": self.errors}
+
+result_store = ResultStore(RESULT_STORE_PATH, SOLVER_VERSION, RESULT_STORE_MAX_BYTES,
+                           RESULT_STORE_TTL) if RESULT_STORE_PATH else None
+
+# Isolated solver worker processes
+SOLVER_WORKERS = int(os.environ.get("SOLVER_WORKERS", os.cpu_count() or 1))
+DEFAULT_SOLVE_TIMEOUT = float(os.environ.get("SOLVE_TIMEOUT", 10))
+
+# Per-type deadlines in seconds, overridable with SOLVE_TIMEOUT_<TYPE>
+SOLVE_TIMEOUTS = {
+    "linear": 5,
+    "quadratic": 5,
+    "system": 10,
+    "inequality": 10,
+    "polynomial": 10,
+    "differentiation": 5,
+    "integration": 20,
+    "trigonometry": 10,
+    "limit": 15
+}
+
+# Cheap problem types that are solved directly in the request thread
+INLINE_TYPES = {"geometry", "statistics"}
+
+class SolverTimeout(Exception):
+    """Raised when a worker does not finish before its deadline."""
+
+    def __init__(self, stacks=None):
+        super().__init__()
+        self.stacks = stacks
+
+class SolverBusy(Exception):
+    """Raised when no worker becomes free in time to take a request."""
+
+class SolverCancelled(Exception):
+    """Raised when the caller cancels a solve that is still running."""
+
+# How often a cancellable solve checks whether it has been cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+def solve_timeout(problem_type):
+    """Return the deadline in seconds for a problem type."""
+    env_value = os.environ.get(f"SOLVE_TIMEOUT_{str(problem_type).upper()}")
+    if env_value:
+        return float(env_value)
+    return float(SOLVE_TIMEOUTS.get(problem_type, DEFAULT_SOLVE_TIMEOUT))
+
+def _solver_worker_main(conn, sample_conn):
+    """Worker process loop: solve tasks received over the pipe until it closes."""
+    global stack_sampler
+    # Ctrl+C is handled by the parent, which tears the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Stacks of a slow solve go out on their own pipe so they survive a kill
+    stack_sampler = StackSampler(SLOW_REQUEST_SECONDS, publish=sample_conn.send)
+    while True:
+        try:
+            task, profile = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            result = run_task(task, profile)
+        except Exception as e:
+            result = ({"error": str(e)}, 500, {})
+        try:
+            conn.send(result)
+        except Exception as e:
+            # The result could not be pickled; report it instead of dying
+            conn.send(({"error": str(e)}, 500, result[2]))
+
+class SolverPool:
+    """Pool of pre-forked solver processes that are killed and replaced on timeout."""
+
+    def __init__(self, size):
+        self.size = size
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.crashes = 0
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        sample_reader, sample_writer = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(target=_solver_worker_main, args=(child_conn, sample_writer), daemon=True)
+        proc.start()
+        child_conn.close()
+        sample_writer.close()
+        worker = (proc, parent_conn, sample_reader)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _discard(self, worker):
+        proc, conn, sample_reader = worker
+        with self._lock:
+            self._workers.discard(worker)
+        if proc.is_alive():
+            proc.kill()
+        proc.join(timeout=1)
+        conn.close()
+        sample_reader.close()
+
+    @staticmethod
+    def _latest_stacks(sample_reader):
+        """Drain a worker's stack snapshots, returning the newest one."""
+        latest = None
+        try:
+            while sample_reader.poll():
+                latest = sample_reader.recv()
+        except (EOFError, OSError):
+            pass
+        return latest
+
+    def run(self, task, timeout, cancel=None):
+        """Run a task on an idle worker, killing the worker if the deadline passes.
+
+        Returns (response, status, report) as produced by run_task.
+
+        If a cancel event is given and gets set, the worker is killed as well and
+        SolverCancelled is raised.
+        """
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise SolverBusy()
+
+        proc, conn, sample_reader = worker
+        healthy = False
+        try:
+            # Drop snapshots left over from the worker's previous task
+            self._latest_stacks(sample_reader)
+            conn.send(task)
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise SolverTimeout(self._latest_stacks(sample_reader))
+                wait = min(remaining, CANCEL_POLL_INTERVAL) if cancel is not None else remaining
+                if conn.poll(wait):
+                    break
+                if cancel is not None and cancel.is_set():
+                    raise SolverCancelled()
+            result = conn.recv()
+            healthy = True
+            return result
+        except (EOFError, OSError):
+            with self._lock:
+                self.crashes += 1
+            return {"error": "Solver worker exited unexpectedly"}, 500, {}
+        finally:
+            if healthy:
+                self._idle.put(worker)
+            else:
+                # Kill the stuck or dead worker and keep the pool at full size
+                self._discard(worker)
+                self._idle.put(self._spawn())
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            self._discard(worker)
+
+# Workers set aside for inputs the complexity estimator expects to be expensive
+SLOW_LANE_WORKERS = int(os.environ.get("SLOW_LANE_WORKERS", max(1, SOLVER_WORKERS // 4)))
+
+_solver_pools = {}
+_solver_pool_lock = threading.Lock()
+
+def get_solver_pool(lane="fast"):
+    """Return the solver pool for a lane, starting it on first use."""
+    if lane == "slow" and SLOW_LANE_WORKERS <= 0:
+        lane = "fast"
+    with _solver_pool_lock:
+        pool = _solver_pools.get(lane)
+        if pool is None:
+            pool = _solver_pools[lane] = SolverPool(SOLVER_WORKERS if lane == "fast" else SLOW_LANE_WORKERS)
+            atexit.register(pool.shutdown)
+        return pool
+
+# Pre-solve complexity estimation
+# Inputs beyond any of these limits are rejected with a 422 before solving
+MAX_EXPRESSION_OPERATIONS = int(os.environ.get("MAX_EXPRESSION_OPERATIONS", 5000))
+MAX_EXPRESSION_DEPTH = int(os.environ.get("MAX_EXPRESSION_DEPTH", 60))
+MAX_EXPONENT = float(os.environ.get("MAX_EXPONENT", 10000))
+MAX_POLY_DEGREE = int(os.environ.get("MAX_POLY_DEGREE", 1000))
+MAX_FREE_SYMBOLS = int(os.environ.get("MAX_FREE_SYMBOLS", 10))
+# Estimated cost from which a solve goes to the slow lane
+SLOW_LANE_COST = float(os.environ.get("SLOW_LANE_COST", 150))
+# Longer inputs are not parsed for estimation and go straight to the slow lane
+ESTIMATE_PARSE_LIMIT = 4096
+
+# How much harder the same expression is for each problem type
+COST_WEIGHTS = {
+    "differentiation": 0.5,
+    "system": 2,
+    "inequality": 2,
+    "trigonometry": 3,
+    "limit": 3,
+    "integration": 4
+}
+
+def expression_parts(problem_type, expression):
+    """Split a problem into the sub-expressions the solver will parse."""
+    if problem_type == "limit":
+        match = re.match(r"limit\(\s*(\w+)\s*,\s*([^,]+)\s*,\s*(.+)\s*\)", expression.strip())
+        return list(match.groups()[1:]) if match else []
+    parts = []
+    for eq_str in expression.split(';'):
+        sides = re.split(r'<=|>=|<|>|=', eq_str)
+        # Plain linear equations never reach SymPy, so they cost nothing to estimate
+        if problem_type == "system" and len(sides) == 2 and parse_linear_equation(*sides) is not None:
+            continue
+        parts.extend(side for side in sides if side.strip())
+    return parts
+
+def _log10_magnitude(node):
+    """log10 of the absolute value of a numeric tree, or None if it has symbols.
+
+    The result is signed, so values below 1 in magnitude come out negative.
+    """
+    if node.is_Number:
+        if node.is_zero:
+            return 0.0
+        if node.is_Rational:
+            return math.log10(abs(node.p)) - math.log10(node.q)
+        return math.log10(abs(float(node)))
+    if node.is_Pow:
+        base = _log10_magnitude(node.base)
+        exponent = _log10_magnitude(node.exp)
+        if base is None or exponent is None:
+            return None
+        if exponent > 300:
+            return math.inf
+        magnitude = base * 10 ** exponent
+        return -magnitude if node.exp.is_negative else magnitude
+    if node.is_Mul or node.is_Add:
+        magnitudes = [_log10_magnitude(arg) for arg in node.args]
+        if any(magnitude is None for magnitude in magnitudes):
+            return None
+        return sum(magnitudes) if node.is_Mul else max(magnitudes) + math.log10(len(magnitudes))
+    return None
+
+def _total_degree(node):
+    """Total polynomial degree of an unevaluated tree, or None if it is not a polynomial."""
+    if node.is_Symbol:
+        return 1
+    if node.is_Number or not node.free_symbols:
+        return 0
+    if node.is_Add or node.is_Mul:
+        degrees = [_total_degree(arg) for arg in node.args]
+        if any(degree is None for degree in degrees):
+            return None
+        return max(degrees) if node.is_Add else sum(degrees)
+    if node.is_Pow:
+        base = _total_degree(node.base)
+        magnitude = _log10_magnitude(node.exp)
+        if base is None or magnitude is None:
+            return None
+        # Exponents of magnitude at most 1 (roots, reciprocals) do not raise the degree
+        return base * 10 ** min(max(magnitude, 0.0), 300)
+    return None
+
+def measure_expression(expr):
+    """Collect size and growth measures of an unevaluated expression tree."""
+    operations = depth = function_depth = 0
+    exponent = 0.0
+    stack = [(expr, 1, 0)]
+    while stack:
+        node, level, functions = stack.pop()
+        depth = max(depth, level)
+        if not node.args:
+            continue
+        operations += 1
+        if operations > MAX_EXPRESSION_OPERATIONS or depth > MAX_EXPRESSION_DEPTH:
+            break
+        if node.is_Function:
+            functions += 1
+            function_depth = max(function_depth, functions)
+        elif node.is_Pow:
+            magnitude = _log10_magnitude(node.exp)
+            if magnitude is not None:
+                exponent = max(exponent, magnitude)
+        stack.extend((arg, level + 1, functions) for arg in node.args)
+    degree = None
+    if operations <= MAX_EXPRESSION_OPERATIONS and depth <= MAX_EXPRESSION_DEPTH:
+        degree = _total_degree(expr)
+    return {
+        "operations": operations,
+        "depth": depth,
+        "functionDepth": function_depth,
+        "exponentDigits": exponent,
+        "degree": degree,
+        "freeSymbols": {str(symbol) for symbol in expr.free_symbols}
+    }
+
+def estimate_complexity(problem_type, expression):
+    """Estimate how expensive a problem is before any real SymPy work is done.
+
+    Returns None when there is nothing to estimate, otherwise a dict with the
+    combined measures, a "cost" score and a "rejected" reason (or None).
+    """
+    if problem_type in INLINE_TYPES or not isinstance(expression, str):
+        return None
+    if len(expression) > ESTIMATE_PARSE_LIMIT:
+        return {"cost": math.inf, "rejected": None, "length": len(expression)}
+
+    estimate = {"operations": 0, "depth": 0, "functionDepth": 0, "exponentDigits": 0.0, "degree": 0}
+    free_symbols = set()
+    for part in expression_parts(problem_type, expression):
+        try:
+            expr = parse_inert(part.strip())
+        except (RecursionError, MemoryError):
+            return dict(estimate, cost=math.inf, rejected="Expression is too deeply nested")
+        except Exception:
+            # Syntax errors are reported by the solver itself
+            return None
+        measures = measure_expression(expr)
+        free_symbols |= measures.pop("freeSymbols")
+        estimate["operations"] += measures["operations"]
+        for key in ("depth", "functionDepth", "exponentDigits"):
+            estimate[key] = max(estimate[key], measures[key])
+        if estimate["degree"] is not None:
+            estimate["degree"] = None if measures["degree"] is None else max(estimate["degree"], measures["degree"])
+    estimate["freeSymbols"] = len(free_symbols)
+
+    if estimate["operations"] > MAX_EXPRESSION_OPERATIONS:
+        rejected = f"Expression is too large (more than {MAX_EXPRESSION_OPERATIONS} operations)"
+    elif estimate["depth"] > MAX_EXPRESSION_DEPTH:
+        rejected = f"Expression is nested too deeply (more than {MAX_EXPRESSION_DEPTH} levels)"
+    elif estimate["exponentDigits"] > math.log10(MAX_EXPONENT):
+        rejected = f"Exponents larger than {MAX_EXPONENT:g} are not supported"
+    elif (estimate["degree"] or 0) > MAX_POLY_DEGREE:
+        rejected = f"Polynomials of degree above {MAX_POLY_DEGREE} are not supported"
+    elif estimate["freeSymbols"] > MAX_FREE_SYMBOLS:
+        rejected = f"Problems with more than {MAX_FREE_SYMBOLS} variables are not supported"
+    else:
+        rejected = None
+
+    cost = (estimate["operations"] + 10 * estimate["functionDepth"] ** 2
+            + (estimate["degree"] or 0) / 2 + 20 * max(0, estimate["freeSymbols"] - 1))
+    estimate["cost"] = cost * COST_WEIGHTS.get(problem_type, 1)
+    estimate["rejected"] = rejected
+    return estimate
+
+metrics.describe("solver_lane_total", "counter", "Pooled solves by execution lane.")
+metrics.describe("solver_complexity_rejected_total", "counter", "Problems rejected by the complexity estimator.")
+
+def run_in_lane(task, profile, timeout, lane, cancel=None):
+    """Run a pooled task in the lane its estimate chose, under the full per-type deadline.
+
+    A solve the estimate misjudged finishes where it started: killing it to retry
+    in the slow lane would throw away its work and count a success as a timeout.
+    """
+    metrics.inc("solver_lane_total", metric_labels(task[0], task[2])[:1] + (("lane", lane),))
+    return get_solver_pool(lane).run((task, profile), timeout, cancel)
+
+# Per-type bulkheads: how many solves of a type may run at once and how many may
+# wait for a slot, overridable with BULKHEAD_LIMIT_<TYPE> and BULKHEAD_QUEUE_<TYPE>.
+# Expensive types get at most half the workers so they cannot starve the rest.
+_POOL_SLOTS = max(1, SOLVER_WORKERS)
+BULKHEAD_LIMITS = {
+    "linear": (_POOL_SLOTS, 4 * _POOL_SLOTS),
+    "quadratic": (_POOL_SLOTS, 4 * _POOL_SLOTS),
+    "differentiation": (_POOL_SLOTS, 4 * _POOL_SLOTS),
+    "system": (max(1, _POOL_SLOTS // 2), _POOL_SLOTS),
+    "inequality": (max(1, _POOL_SLOTS // 2), _POOL_SLOTS),
+    "polynomial": (max(1, _POOL_SLOTS // 2), _POOL_SLOTS),
+    "integration": (max(1, _POOL_SLOTS // 2), _POOL_SLOTS),
+    "trigonometry": (max(1, _POOL_SLOTS // 2), _POOL_SLOTS),
+    "limit": (max(1, _POOL_SLOTS // 2), _POOL_SLOTS),
+    "geometry": (32, 128),
+    "statistics": (8, 32)
+}
+# Longest a request waits for a bulkhead slot before giving up with a 503
+BULKHEAD_QUEUE_WAIT = float(os.environ.get("BULKHEAD_QUEUE_WAIT", 5))
+
+class BulkheadFull(Exception):
+    """Raised when a problem type's bulkhead cannot take another request."""
+
+    def __init__(self, status, retry_after):
+        super().__init__()
+        self.status = status
+        self.retry_after = retry_after
+
+class Bulkhead:
+    """Caps the concurrent solves of one problem type, with a bounded wait queue."""
+
+    def __init__(self, name, limit, max_queued):
+        self.name = name
+        self.limit = limit
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self._cond = threading.Condition()
+        # Smoothed time a slot is held, used for Retry-After hints
+        self._hold_seconds = 1.0
+
+    def retry_after(self):
+        """Rough number of seconds until the requests ahead have drained."""
+        return max(1, math.ceil(self._hold_seconds * (self.queued + 1) / self.limit))
+
+    def _reject(self, status, reason):
+        metrics.inc("solver_bulkhead_rejected_total", (("type", self.name), ("reason", reason)))
+        raise BulkheadFull(status, self.retry_after())
+
+    @contextmanager
+    def slot(self, wait=BULKHEAD_QUEUE_WAIT):
+        with self._cond:
+            if self.active >= self.limit:
+                if self.queued >= self.max_queued:
+                    self._reject(429, "queue_full")
+                self.queued += 1
+                try:
+                    acquired = self._cond.wait_for(lambda: self.active < self.limit, timeout=wait)
+                finally:
+                    self.queued -= 1
+                if not acquired:
+                    self._reject(503, "queue_timeout")
+            self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.monotonic() - start)
+                self._cond.notify()
+
+metrics.describe("solver_bulkhead_rejected_total", "counter", "Requests shed by a problem type's bulkhead.")
+
+_bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+def bulkhead_for(problem_type):
+    """Return the bulkhead for a problem type, or None for unknown types."""
+    if problem_type not in BULKHEAD_LIMITS:
+        return None
+    with _bulkheads_lock:
+        bulkhead = _bulkheads.get(problem_type)
+        if bulkhead is None:
+            limit, max_queued = BULKHEAD_LIMITS[problem_type]
+            limit = int(os.environ.get(f"BULKHEAD_LIMIT_{problem_type.upper()}", limit))
+            max_queued = int(os.environ.get(f"BULKHEAD_QUEUE_{problem_type.upper()}", max_queued))
+            bulkhead = _bulkheads[problem_type] = Bulkhead(problem_type, max(1, limit), max(0, max_queued))
+        return bulkhead
+
+def bulkhead_slot(problem_type):
+    """Context manager holding a bulkhead slot for the type; raises BulkheadFull."""
+    bulkhead = bulkhead_for(problem_type) if isinstance(problem_type, str) else None
+    return bulkhead.slot() if bulkhead is not None else nullcontext()
+
+def shed_response(error):
+    return {"error": "Too many requests of this problem type, please retry later",
+            "retryAfter": error.retry_after}, error.status
+
+metrics.describe("solver_method_total", "counter", "Answers by problem type and the method or tier that found them.")
+
+def run_solver(problem_type, expression, sub_type, options=None, cancel=None, profile=False, lane="fast"):
+    """Solve a problem in a worker process under its per-type deadline.
+
+    Returns (response, status, report); see run_task for the report.
+    """
+    task = (problem_type, expression, sub_type, options)
+    start = time.perf_counter()
+    if problem_type in INLINE_TYPES or SOLVER_WORKERS <= 0:
+        response, status, report = run_task(task, profile)
+    else:
+        timeout = solve_timeout(problem_type)
+        try:
+            response, status, report = run_in_lane(task, profile, timeout, lane, cancel)
+        except SolverTimeout as e:
+            response = {"error": f"Solving took longer than {timeout:g} seconds and was stopped"}
+            status, report = 504, {"stacks": e.stacks or []}
+        except SolverBusy:
+            return {"error": "All solver workers are busy, please retry", "retryAfter": 1}, 503, {}
+    elapsed = time.perf_counter() - start
+    record_stages(problem_type, sub_type, report.get("stages", {}))
+    if status == 200 and "method" in response:
+        metrics.inc("solver_method_total", metric_labels(problem_type, sub_type) + (("method", response["method"]),))
+    if SLOW_REQUEST_SECONDS > 0 and elapsed >= SLOW_REQUEST_SECONDS:
+        record_slow_request(task, status, elapsed, report)
+    return response, status, report
+
+def solve_cached(problem_type, expression, sub_type, options=None, cancel=None, profile=False):
+    """Return the (response, status) for a problem, using the result cache.
+
+    A profiled solve always runs, and its response gets a "profile" field.
+    """
+    with tracked_request(problem_type, sub_type) as outcome:
+        response, status = _solve_cached(problem_type, expression, sub_type, options, cancel, profile)
+        outcome["status"] = status
+        return response, status
+
+def _solve_cached(problem_type, expression, sub_type, options, cancel, profile):
+    try:
+        # Large inputs such as big datasets would crowd out everything else
+        if len(expression) > MAX_CACHED_EXPRESSION or parameter_values(options) > MAX_CACHED_PARAMETER_VALUES:
+            key = None
+        else:
+            key = cache_key(problem_type, expression, sub_type, options)
+    except Exception:
+        key = None
+
+    if key is not None and not profile:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached, 200
+        # Another process, or this one before a restart, may have solved it already
+        stored = result_store.get(key) if result_store is not None else None
+        if stored is not None:
+            result_cache.put(key, stored)
+            return stored, 200
+
+    estimate = estimate_complexity(problem_type, expression)
+    if estimate is not None and estimate["rejected"]:
+        metrics.inc("solver_complexity_rejected_total", metric_labels(problem_type, sub_type))
+        measures = {name: (None if not math.isfinite(value) else round(value, 3)) if isinstance(value, float) else value
+                    for name, value in estimate.items() if name != "rejected"}
+        return {"error": estimate["rejected"], "complexity": measures}, 422
+    lane = "slow" if estimate is not None and estimate["cost"] >= SLOW_LANE_COST else "fast"
+
+    try:
+        with bulkhead_slot(problem_type):
+            response, status, report = run_solver(problem_type, expression, sub_type, options, cancel,
+                                                  profile, lane)
+    except BulkheadFull as e:
+        return shed_response(e)
+
+    # Only successful answers are cached; errors are cheap to recompute
+    if key is not None and status == 200:
+        result_cache.put(key, response)
+        if result_store is not None:
+            result_store.put(key, response)
+    if profile:
+        # A copy, so the cached response stays free of profile data
+        response = dict(response, profile={"stages": report.get("stages", {}),
+                                           "functions": report.get("profile", [])})
+    return response, status
+
+# Optional /solve request fields that change the result
+SOLVE_OPTIONS = ("graph", "bounds", "interval", "direction", "output", "parameterSets", "verbosity")
+
+def solve_options(data):
+    """Pick the optional solver settings out of a request body."""
+    return {key: data[key] for key in SOLVE_OPTIONS if key in data}
 
 @app.route('/')
 def home():
     return jsonify({"message": "Math Solver API is running"})
 
-@app.route('/problem_types', methods=['GET'])
-def get_problem_types():
-    """Returns available problem types for the Flutter UI to display."""
-    problem_types = {
-        "types": [
-            {"id": "linear", "name": "Linear Equation", "hasSubtypes": False},
-            {"id": "quadratic", "name": "Quadratic Equation", "hasSubtypes": False},
-            {"id": "system", "name": "System of Equations", "hasSubtypes": False},
-            {"id": "inequality", "name": "Inequality", "hasSubtypes": False},
-            {"id": "polynomial", "name": "Polynomial Equation", "hasSubtypes": False},
-            {"id": "geometry", "name": "Geometry", "hasSubtypes": True},
-            {"id": "differentiation", "name": "Differentiation", "hasSubtypes": False},
-            {"id": "integration", "name": "Integration", "hasSubtypes": False},
-            {"id": "trigonometry", "name": "Trigonometric Equations", "hasSubtypes": False},
-            {"id": "limit", "name": "Limits", "hasSubtypes": False},
-            {"id": "statistics", "name": "Statistics", "hasSubtypes": True}
+# Problem types offered to the Flutter UI, with example inputs for each
+PROBLEM_TYPES = {
+    "types": [
+        {"id": "linear", "name": "Linear Equation", "hasSubtypes": False},
+        {"id": "quadratic", "name": "Quadratic Equation", "hasSubtypes": False},
+        {"id": "system", "name": "System of Equations", "hasSubtypes": False},
+        {"id": "inequality", "name": "Inequality", "hasSubtypes": False},
+        {"id": "polynomial", "name": "Polynomial Equation", "hasSubtypes": False},
+        {"id": "geometry", "name": "Geometry", "hasSubtypes": True},
+        {"id": "differentiation", "name": "Differentiation", "hasSubtypes": False},
+        {"id": "integration", "name": "Integration", "hasSubtypes": False},
+        {"id": "trigonometry", "name": "Trigonometric Equations", "hasSubtypes": False},
+        {"id": "limit", "name": "Limits", "hasSubtypes": False},
+        {"id": "statistics", "name": "Statistics", "hasSubtypes": True}
+    ],
+    "subtypes": {
+        "geometry": [
+            {"id": "circle_area", "name": "Circle Area"},
+            {"id": "circle_circumference", "name": "Circle Circumference"},
+            {"id": "triangle_area", "name": "Triangle Area"},
+            {"id": "rectangle_area", "name": "Rectangle Area"},
+            {"id": "sphere_volume", "name": "Sphere Volume"}
         ],
-        "subtypes": {
-            "geometry": [
-                {"id": "circle_area", "name": "Circle Area"},
-                {"id": "circle_circumference", "name": "Circle Circumference"},
-                {"id": "triangle_area", "name": "Triangle Area"},
-                {"id": "rectangle_area", "name": "Rectangle Area"},
-                {"id": "sphere_volume", "name": "Sphere Volume"}
-            ],
-            "statistics": [
-                {"id": "mean", "name": "Mean (Average)"},
-                {"id": "median", "name": "Median"},
-                {"id": "mode", "name": "Mode"},
-                {"id": "standard_deviation", "name": "Standard Deviation"},
-                {"id": "variance", "name": "Variance"},
-                {"id": "range", "name": "Range"}
-            ]
-        },
-        "examples": {
-            "linear": "2*x + 3 = 7",
-            "quadratic": "x**2 + 5*x + 6 = 0",
-            "system": "x + y = 10; 2*x - y = 5",
-            "inequality": "x**2 - 4 < 0",
-            "polynomial": "x**3 - 6*x**2 + 11*x - 6 = 0",
-            "differentiation": "x**2 + 3*x + 2",
-            "integration": "2*x + 3",
-            "trigonometry": "sin(x) = 0.5",
-            "limit": "limit(x, 0, (sin(x)/x))",
-            "statistics": "data = [10, 20, 30, 40, 50]",
-            "geometry": {
-                "circle_area": "radius = 5",
-                "circle_circumference": "radius = 5",
-                "triangle_area": "base = 5; height = 8",
-                "rectangle_area": "length = 5; width = 10",
-                "sphere_volume": "radius = 3"
-            }
+        "statistics": [
+            {"id": "mean", "name": "Mean (Average)"},
+            {"id": "median", "name": "Median"},
+            {"id": "mode", "name": "Mode"},
+            {"id": "standard_deviation", "name": "Standard Deviation"},
+            {"id": "variance", "name": "Variance"},
+            {"id": "range", "name": "Range"}
+        ]
+    },
+    "examples": {
+        "linear": "2*x + 3 = 7",
+        "quadratic": "x**2 + 5*x + 6 = 0",
+        "system": "x + y = 10; 2*x - y = 5",
+        "inequality": "x**2 - 4 < 0",
+        "polynomial": "x**3 - 6*x**2 + 11*x - 6 = 0",
+        "differentiation": "x**2 + 3*x + 2",
+        "integration": "2*x + 3",
+        "trigonometry": "sin(x) = 0.5",
+        "limit": "limit(x, 0, (sin(x)/x))",
+        "statistics": "data = [10, 20, 30, 40, 50]",
+        "geometry": {
+            "circle_area": "radius = 5",
+            "circle_circumference": "radius = 5",
+            "triangle_area": "base = 5; height = 8",
+            "rectangle_area": "length = 5; width = 10",
+            "sphere_volume": "radius = 3"
         }
     }
-    return jsonify(problem_types)
+}
 
-@app.route('/solve', methods=['POST'])
-def solve_problem():
+# HTTP caching
+PROBLEM_TYPES_MAX_AGE = int(os.environ.get("PROBLEM_TYPES_MAX_AGE", 86400))
+# max-age for /solve answers; 0 means clients and CDNs must revalidate with the ETag
+SOLVE_MAX_AGE = int(os.environ.get("SOLVE_MAX_AGE", 0))
+
+@lru_cache(maxsize=None)
+def _problem_types_body():
+    """PROBLEM_TYPES serialized once, with its ETag."""
+    body = json.dumps(PROBLEM_TYPES, sort_keys=True, separators=(',', ':')).encode()
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+@app.route('/problem_types', methods=['GET'])
+def get_problem_types():
+    """Returns available problem types for the Flutter UI to display."""
+    body, etag = _problem_types_body()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = SOLVER_BUILD_TIME
+    response.cache_control.public = True
+    response.cache_control.max_age = PROBLEM_TYPES_MAX_AGE
+    return response.make_conditional(request)
+
+def compute_solution(problem_type, expression, sub_type, options=None):
+    """Solve a single problem and return a (response, status) tuple."""
+    options = options or {}
     try:
-        data = request.json
-        problem_type = data.get('type')
-        expression = data.get('expression')
-        sub_type = data.get('subType', '')
+        graph_settings = parse_graph_options(options.get('graph'))
+    except (TypeError, ValueError) as e:
+        return {"error": f"Invalid graph options: {str(e)}"}, 400
 
-        steps = []
-        solution = None
-        graph_data = None
+    # Geometry answers keep π symbolic unless numeric output is asked for
+    output = options.get('output', "numeric" if problem_type == "statistics" else "exact")
+    if output not in OUTPUT_MODES:
+        return {"error": f"output must be one of: {', '.join(OUTPUT_MODES)}"}, 400
+    verbosity = options.get('verbosity', "full")
+    if verbosity not in VERBOSITY_LEVELS:
+        return {"error": f"verbosity must be one of: {', '.join(VERBOSITY_LEVELS)}"}, 400
+    steps = StepLog(verbosity)
+    if 'parameterSets' in options:
+        if problem_type == "geometry":
+            return solve_geometry_batch(sub_type, options['parameterSets'], output, steps)
+        if problem_type == "statistics":
+            return solve_statistics_batch(options['parameterSets'], sub_type, output, steps)
+        return {"error": "parameterSets is only supported for geometry and statistics"}, 400
 
-        if problem_type == "linear":
-            lhs, rhs = expression.split('=')
-            lhs_expr = safe_eval(lhs.strip())
-            rhs_expr = safe_eval(rhs.strip())
-            eq = Eq(lhs_expr, rhs_expr)
-            
-            steps.append(f"Formulate the equation: {lhs} = {rhs}")
-            steps.append(f"Move all terms to the left side: {lhs} - ({rhs}) = 0")
-            simplified = lhs_expr - rhs_expr
-            steps.append(f"Simplified equation: {simplified} = 0")
-            
-            # Check which variable to solve for
-            var_to_solve = None
-            for var in [x, y, z]:
-                if var in simplified.free_symbols:
-                    var_to_solve = var
-                    break
-            
-            if var_to_solve:
-                steps.append(f"Solve for {var_to_solve}")
-                solution = solve(eq, var_to_solve)
-                if solution:
-                    steps.append(f"Solution: {var_to_solve} = {solution[0]}")
+    solution = None
+    graph_data = None
+    # Extra top-level fields, such as which method answered where a type has several
+    details = {}
+
+    if problem_type == "linear":
+        lhs, rhs = expression.split('=')
+        lhs_expr = parse_math(lhs.strip())
+        rhs_expr = parse_math(rhs.strip())
+        eq = Eq(lhs_expr, rhs_expr)
+        
+        steps.append(f"Formulate the equation: {lhs} = {rhs}")
+        steps.append(f"Move all terms to the left side: {lhs} - ({rhs}) = 0")
+        simplified = lhs_expr - rhs_expr
+        steps.add("Simplified equation: {} = 0", simplified)
+        
+        # Check which variable to solve for
+        var_to_solve = None
+        for var in [x, y, z]:
+            if var in simplified.free_symbols:
+                var_to_solve = var
+                break
+        
+        if var_to_solve:
+            steps.append(f"Solve for {var_to_solve}")
+            solution = solve(eq, var_to_solve)
+            if solution:
+                with timed_stage("steps"):
                     solution = f"{var_to_solve} = {solution[0]}"
-                else:
-                    steps.append("No solution found")
-                    solution = "No solution"
+                    steps.add("Solution: {}", solution)
             else:
-                steps.append("No variable found to solve for")
-                solution = "No variable found"
-
-        elif problem_type == "quadratic":
-            lhs, rhs = expression.split('=')
-            lhs_expr = safe_eval(lhs.strip())
-            rhs_expr = safe_eval(rhs.strip())
-            eq = Eq(lhs_expr, rhs_expr)
-            
-            steps.append(f"Write the equation: {lhs} = {rhs}")
-            steps.append(f"Move all terms to the left side: {lhs} - ({rhs}) = 0")
-            
-            # Move everything to the left side
-            expr = lhs_expr - rhs_expr
-            steps.append(f"Standard form: {expr} = 0")
-            
-            # Try to identify the variable
-            var_to_solve = None
-            for var in [x, y, z]:
-                if var in expr.free_symbols:
-                    var_to_solve = var
-                    break
-                    
-            if not var_to_solve:
-                return jsonify({"error": "No variable found in equation"}), 400
+                steps.append("No solution found")
+                solution = "No solution"
+        else:
+            steps.append("No variable found to solve for")
+            solution = "No variable found"
+
+    elif problem_type == "quadratic":
+        lhs, rhs = expression.split('=')
+        lhs_expr = parse_math(lhs.strip())
+        rhs_expr = parse_math(rhs.strip())
+        eq = Eq(lhs_expr, rhs_expr)
+        
+        steps.append(f"Write the equation: {lhs} = {rhs}")
+        steps.append(f"Move all terms to the left side: {lhs} - ({rhs}) = 0")
+        
+        # Move everything to the left side
+        expr = lhs_expr - rhs_expr
+        steps.add("Standard form: {} = 0", expr)
+        
+        # Try to identify the variable
+        var_to_solve = None
+        for var in [x, y, z]:
+            if var in expr.free_symbols:
+                var_to_solve = var
+                break
                 
-            steps.append(f"Identify this as a quadratic equation in {var_to_solve}")
-            steps.append("Use the quadratic formula: x = [-b ± √(b² - 4ac)] / 2a")
+        if not var_to_solve:
+            return {"error": "No variable found in equation"}, 400
             
+        steps.append(f"Identify this as a quadratic equation in {var_to_solve}")
+        steps.append("Use the quadratic formula: x = [-b ± √(b² - 4ac)] / 2a")
+        
+        poly = as_numeric_poly(expr, var_to_solve)
+        if poly is not None:
+            solutions, _ = polynomial_roots(poly)
+        else:
             solutions = solve(eq, var_to_solve)
-            
+        
+        with timed_stage("steps"):
             if len(solutions) == 2:
                 steps.append(f"Calculate the discriminant and find two roots")
                 solution = f"{var_to_solve} = {solutions[0]} or {var_to_solve} = {solutions[1]}"
@@ -163,41 +2947,69 @@ def solve_problem():
             else:
                 steps.append(f"No real solutions found")
                 solution = "No real solutions"
-                
-            # Prepare graph data for Flutter
-            coeffs = Eq(expr, 0).as_poly().all_coeffs()
-            x_vals = list(range(-10, 11))
-            y_vals = [sum(c * (x_val ** i) for i, c in enumerate(reversed(coeffs))) for x_val in x_vals]
-            graph_data = {
-                "type": "polynomial",
-                "points": [{"x": x_val, "y": float(y_val)} for x_val, y_val in zip(x_vals, y_vals)],
-                "roots": [float(sol) for sol in solutions if sol.is_real]
-            }
+            
+        # Prepare graph data for Flutter
+        if poly is not None:
+            x_vals, (y_vals,), _ = sample_functions([horner_function(poly)], -10, 10, graph_settings)
+        else:
+            x_vals, (y_vals,), _ = sample_expressions([expr], var_to_solve, -10, 10, graph_settings)
+        graph_data = {
+            "type": "polynomial",
+            "points": to_points(x_vals, y_vals),
+            "roots": [float(sol) for sol in solutions if sol.is_real]
+        }
 
-        elif problem_type == "system":
-            equations = expression.split(';')
-            system_eqs = []
+    elif problem_type == "system":
+        equations = expression.split(';')
+        system_eqs = []
+        rows = []
+        
+        steps.append("Write the system of equations:")
+        
+        # Plain linear equations are read straight into coefficient rows; anything
+        # else is parsed into SymPy equation objects
+        for i, eq_str in enumerate(equations):
+            if '=' not in eq_str:
+                return {"error": f"Equation {i+1} does not contain an equals sign"}, 400
+                
+            lhs, rhs = eq_str.split('=')
+            row = parse_linear_equation(lhs, rhs)
+            if row is None:
+                lhs_expr = parse_math(lhs.strip())
+                rhs_expr = parse_math(rhs.strip())
+                eq = Eq(lhs_expr, rhs_expr)
+                row = linear_row(lhs_expr - rhs_expr)
+            else:
+                eq = None
+            system_eqs.append(eq)
+            rows.append(row)
+            steps.append(f"Equation {i+1}: {lhs} = {rhs}")
+        
+        if all(row is not None for row in rows):
+            variables = set()
+            for coeffs, _ in rows:
+                variables.update(coeffs)
+            variables = sorted(variables, key=variable_sort_key)
             
-            steps.append("Write the system of equations:")
+            if len(variables) != len(rows):
+                steps.append(f"Note: The system has {len(variables)} variables and {len(rows)} equations.")
             
-            # Parse each equation and convert to SymPy equation objects
-            for i, eq_str in enumerate(equations):
-                if '=' not in eq_str:
-                    return jsonify({"error": f"Equation {i+1} does not contain an equals sign"}), 400
-                    
-                lhs, rhs = eq_str.split('=')
-                lhs_expr = safe_eval(lhs.strip())
-                rhs_expr = safe_eval(rhs.strip())
-                eq = Eq(lhs_expr, rhs_expr)
-                system_eqs.append(eq)
-                steps.append(f"Equation {i+1}: {lhs} = {rhs}")
+            solution, linear_steps = solve_linear_system(rows, variables)
+            steps.extend(linear_steps)
+            steps.add("Found solution: {}", solution)
+        else:
+            # Nonlinear system: rebuild any equations that took the linear fast path
+            for i, row in enumerate(rows):
+                if system_eqs[i] is None:
+                    coeffs, constant = row
+                    system_eqs[i] = Eq(sum((coeff * var for var, coeff in coeffs.items()), S.Zero), -constant)
             
             # Collect variables in the system
             variables = set()
             for eq in system_eqs:
                 variables.update(eq.free_symbols)
             
-            variables = list(variables)
+            variables = sorted(variables, key=variable_sort_key)
             
             if len(variables) != len(system_eqs):
                 steps.append(f"Note: The system has {len(variables)} variables and {len(system_eqs)} equations.")
@@ -208,11 +3020,12 @@ def solve_problem():
                 solution_dict = solve(system_eqs, variables)
                 
                 if solution_dict:
-                    solution_parts = []
-                    for var, val in solution_dict.items():
-                        solution_parts.append(f"{var} = {val}")
-                    solution = ", ".join(solution_parts)
-                    steps.append("Found solution: " + solution)
+                    with timed_stage("steps"):
+                        solution_parts = []
+                        for var, val in solution_dict.items():
+                            solution_parts.append(f"{var} = {val}")
+                        solution = ", ".join(solution_parts)
+                        steps.add("Found solution: {}", solution)
                 else:
                     steps.append("No solution found for the system.")
                     solution = "No solution"
@@ -220,95 +3033,106 @@ def solve_problem():
                 steps.append(f"Error solving system: {str(e)}")
                 solution = "Could not solve system"
 
-        elif problem_type == "inequality":
-            try:
-                # Try to parse directly as an inequality
-                ineq_expr = eval(expression, {"__builtins__": {}}, 
-                                {"x": x, "y": y, "z": z, "<": lambda a, b: a < b, 
-                                 ">": lambda a, b: a > b, "<=": lambda a, b: a <= b, 
-                                 ">=": lambda a, b: a >= b})
-                
-                steps.append(f"Inequality: {expression}")
-                
-                # Find the variable
-                variables = ineq_expr.free_symbols
-                if not variables:
-                    return jsonify({"error": "No variable found in inequality"}), 400
-                
-                var = list(variables)[0]
-                steps.append(f"Solve for {var}")
-                
-                solution = solve_univariate_inequality(ineq_expr, var)
-                steps.append(f"Solution: {solution}")
-                
-            except Exception:
-                # If direct parsing fails, try to split by inequality operators
-                for op in ['<=', '>=', '<', '>']:
-                    if op in expression:
-                        parts = expression.split(op)
-                        if len(parts) == 2:
-                            lhs = safe_eval(parts[0].strip())
-                            rhs = safe_eval(parts[1].strip())
-                            
-                            steps.append(f"Inequality: {parts[0]} {op} {parts[1]}")
-                            
-                            # Find the variable
-                            variables = set()
-                            variables.update(lhs.free_symbols)
-                            variables.update(rhs.free_symbols)
-                            
-                            if not variables:
-                                return jsonify({"error": "No variable found in inequality"}), 400
-                            
-                            var = list(variables)[0]
-                            steps.append(f"Solve for {var}")
-                            
-                            # Create the inequality expression
-                            if op == '<':
-                                ineq_expr = lhs < rhs
-                            elif op == '>':
-                                ineq_expr = lhs > rhs
-                            elif op == '<=':
-                                ineq_expr = lhs <= rhs
-                            elif op == '>=':
-                                ineq_expr = lhs >= rhs
-                            
-                            solution = solve_univariate_inequality(ineq_expr, var)
-                            steps.append(f"Solution: {solution}")
-                            break
-                else:
-                    return jsonify({"error": "Invalid inequality format"}), 400
+    elif problem_type == "inequality":
+        parts = split_inequality(expression)
+        if parts is None:
+            return {"error": "Invalid inequality format"}, 400
+        lhs, op, rhs = parts
+        lhs_expr = parse_math(lhs)
+        rhs_expr = parse_math(rhs)
+        steps.append(f"Inequality: {lhs} {op} {rhs}")
+        
+        # Find the variable
+        variables = lhs_expr.free_symbols | rhs_expr.free_symbols
+        if not variables:
+            return {"error": "No variable found in inequality"}, 400
+        if len(variables) > 1:
+            return {"error": "Inequality must contain a single variable"}, 400
+        var = variables.pop()
+        steps.append(f"Solve for {var}")
+        steps.append(f"Move all terms to the left side: {lhs} - ({rhs}) {op} 0")
 
-        elif problem_type == "polynomial":
-            if '=' not in expression:
-                return jsonify({"error": "Equation must contain an equals sign"}), 400
-                
-            lhs, rhs = expression.split('=')
-            lhs_expr = safe_eval(lhs.strip())
-            rhs_expr = safe_eval(rhs.strip())
-            eq = Eq(lhs_expr, rhs_expr)
-            
-            steps.append(f"Write the polynomial equation: {lhs} = {rhs}")
-            steps.append(f"Move all terms to the left side: {lhs} - ({rhs}) = 0")
-            
-            # Move everything to the left side
-            expr = lhs_expr - rhs_expr
-            steps.append(f"Standard form: {expr} = 0")
+        try:
+            numerator, denominator = together(lhs_expr - rhs_expr).as_numer_denom()
+            num_poly, den_poly = as_numeric_poly(numerator, var), as_numeric_poly(denominator, var)
+            if num_poly is not None and den_poly is not None:
+                points, signs = sign_chart(num_poly.set_domain(QQ), den_poly.set_domain(QQ))
+                pieces = solution_intervals(points, signs, op)
+                with timed_stage("steps"):
+                    # The factor and sign listings are only built when steps are returned
+                    if steps.enabled:
+                        if den_poly.degree() > 0:
+                            steps.add("Rational form: ({}) / ({}) {} 0", numerator, denominator, op)
+                        for kind, text in (("zero", "Zeros of the numerator"), ("pole", "Zeros of the denominator (excluded)")):
+                            found = [_format_boundary(point["value"]) for point in points if point["kind"] == kind]
+                            if found:
+                                steps.append(f"{text}: {', '.join(found)}")
+                        regions = []
+                        for i, region_sign in enumerate(signs):
+                            lower = _format_boundary(points[i - 1]["value"]) if i > 0 else "-∞"
+                            upper = _format_boundary(points[i]["value"]) if i < len(points) else "∞"
+                            regions.append(f"({lower}, {upper}): {'+' if region_sign > 0 else '-' if region_sign < 0 else '0'}")
+                        steps.append("Sign chart: " + "; ".join(regions))
+                    solution = f"{var} ∈ {format_intervals(pieces)}"
+                    steps.add("Solution: {}", solution)
+                graph_data = {
+                    "type": "sign_chart",
+                    "criticalPoints": [{"x": float(point["value"]), "value": str(point["value"]),
+                                        "exact": point["exact"], "kind": point["kind"]} for point in points],
+                    "signs": signs,
+                    "intervals": [{"lower": None if lower is None else float(lower),
+                                   "upper": None if upper is None else float(upper),
+                                   "lowerClosed": lower_closed, "upperClosed": upper_closed}
+                                  for lower, upper, lower_closed, upper_closed in pieces]
+                }
+                details = {"method": "sign chart"}
+            else:
+                # Transcendental inequalities need the general solver
+                from sympy.solvers.inequalities import solve_univariate_inequality
+                relation = {'<': Lt, '>': Gt, '<=': Le, '>=': Ge}[op]
+                result = solve_univariate_inequality(relation(lhs_expr, rhs_expr), var, relational=False)
+                solution = f"{var} ∈ {result}"
+                steps.add("Solution: {}", solution)
+                details = {"method": "general"}
+        except Exception as e:
+            return {"error": f"Error solving inequality: {str(e)}"}, 400
+
+    elif problem_type == "polynomial":
+        if '=' not in expression:
+            return {"error": "Equation must contain an equals sign"}, 400
             
-            # Try to identify the variable
-            var_to_solve = None
-            for var in [x, y, z]:
-                if var in expr.free_symbols:
-                    var_to_solve = var
-                    break
-                    
-            if not var_to_solve:
-                return jsonify({"error": "No variable found in equation"}), 400
+        lhs, rhs = expression.split('=')
+        lhs_expr = parse_math(lhs.strip())
+        rhs_expr = parse_math(rhs.strip())
+        eq = Eq(lhs_expr, rhs_expr)
+        
+        steps.append(f"Write the polynomial equation: {lhs} = {rhs}")
+        steps.append(f"Move all terms to the left side: {lhs} - ({rhs}) = 0")
+        
+        # Move everything to the left side
+        expr = lhs_expr - rhs_expr
+        steps.add("Standard form: {} = 0", expr)
+        
+        # Try to identify the variable
+        var_to_solve = None
+        for var in [x, y, z]:
+            if var in expr.free_symbols:
+                var_to_solve = var
+                break
                 
-            steps.append(f"Find the roots of the polynomial in {var_to_solve}")
+        if not var_to_solve:
+            return {"error": "No variable found in equation"}, 400
             
+        steps.append(f"Find the roots of the polynomial in {var_to_solve}")
+        
+        poly = as_numeric_poly(expr, var_to_solve)
+        if poly is not None:
+            solutions, method = polynomial_roots(poly)
+            steps.append(f"Degree {poly.degree()} polynomial, roots found by {method}")
+        else:
             solutions = solve(eq, var_to_solve)
-            
+        
+        with timed_stage("steps"):
             if solutions:
                 solution_strs = [f"{var_to_solve} = {sol}" for sol in solutions]
                 steps.append(f"Found {len(solutions)} solution(s)")
@@ -316,411 +3140,1004 @@ def solve_problem():
             else:
                 steps.append(f"No real solutions found")
                 solution = "No real solutions"
+            
+        # Prepare graph data for Flutter
+        try:
+            if poly is not None:
+                x_vals, (y_vals,), _ = sample_functions([horner_function(poly)], -10, 10, graph_settings)
+            else:
+                x_vals, (y_vals,), _ = sample_expressions([expr], var_to_solve, -10, 10, graph_settings)
+            graph_data = {
+                "type": "polynomial",
+                "points": to_points(x_vals, y_vals),
+                "roots": [float(sol) for sol in solutions if sol.is_real]
+            }
+        except Exception as e:
+            # If graphing fails, continue without it
+            pass
+
+    elif problem_type == "geometry":
+        steps.append(f"Geometry problem type: {sub_type}")
+        pi_value = math.pi if output == "numeric" else pi
+        
+        try:
+            # Parse the expression to extract values
+            params = {}
+            for part in expression.split(';'):
+                if '=' in part:
+                    key, value = part.split('=')
+                    params[key.strip()] = float(value.strip())
+            
+            if sub_type == "circle_area":
+                if 'radius' in params:
+                    r = params['radius']
+                    steps.append(f"Circle with radius = {r}")
+                    steps.append(f"Area of a circle: A = π × r²")
+                    area = pi_value * r**2
+                    steps.append(f"A = π × {r}² = {area}")
+                    solution = f"Area = {area}"
+                    graph_data = {
+                        "type": "circle",
+                        "radius": float(r)
+                    }
+                    
+            elif sub_type == "circle_circumference":
+                if 'radius' in params:
+                    r = params['radius']
+                    steps.append(f"Circle with radius = {r}")
+                    steps.append(f"Circumference of a circle: C = 2π × r")
+                    circumference = 2 * pi_value * r
+                    steps.append(f"C = 2π × {r} = {circumference}")
+                    solution = f"Circumference = {circumference}"
+                    graph_data = {
+                        "type": "circle",
+                        "radius": float(r)
+                    }
+                    
+            elif sub_type == "triangle_area":
+                if 'base' in params and 'height' in params:
+                    b = params['base']
+                    h = params['height']
+                    steps.append(f"Triangle with base = {b} and height = {h}")
+                    steps.append(f"Area of a triangle: A = (b × h) / 2")
+                    area = (b * h) / 2
+                    steps.append(f"A = ({b} × {h}) / 2 = {area}")
+                    solution = f"Area = {area}"
+                    graph_data = {
+                        "type": "triangle",
+                        "base": float(b),
+                        "height": float(h)
+                    }
+                    
+            elif sub_type == "rectangle_area":
+                if 'length' in params and 'width' in params:
+                    l = params['length']
+                    w = params['width']
+                    steps.append(f"Rectangle with length = {l} and width = {w}")
+                    steps.append(f"Area of a rectangle: A = l × w")
+                    area = l * w
+                    steps.append(f"A = {l} × {w} = {area}")
+                    solution = f"Area = {area}"
+                    graph_data = {
+                        "type": "rectangle",
+                        "length": float(l),
+                        "width": float(w)
+                    }
+                    
+            elif sub_type == "sphere_volume":
+                if 'radius' in params:
+                    r = params['radius']
+                    steps.append(f"Sphere with radius = {r}")
+                    steps.append(f"Volume of a sphere: V = (4/3) × π × r³")
+                    volume = (4/3) * pi_value * r**3
+                    steps.append(f"V = (4/3) × π × {r}³ = {volume}")
+                    solution = f"Volume = {volume}"
+                    graph_data = {
+                        "type": "sphere",
+                        "radius": float(r)
+                    }
+                    
+            else:
+                return {"error": "Unsupported geometry sub-type"}, 400
                 
+        except Exception as e:
+            return {"error": f"Error in geometry calculation: {str(e)}"}, 400
+
+    elif problem_type == "differentiation":
+        steps.add("Expression to differentiate: {}", expression)
+        steps.append("Find the derivative with respect to x")
+        
+        try:
+            expr = parse_math(expression)
+            derivative = diff(expr, x)
+            with timed_stage("steps"):
+                steps.append(f"Apply the rules of differentiation")
+                steps.add("The derivative is: {}", derivative)
+                solution = f"f'(x) = {derivative}"
+            
             # Prepare graph data for Flutter
             try:
-                coeffs = Eq(expr, 0).as_poly().all_coeffs()
-                x_vals = list(range(-10, 11))
-                y_vals = [sum(c * (x_val ** i) for i, c in enumerate(reversed(coeffs))) for x_val in x_vals]
+                x_vals, (y_vals_orig, y_vals_deriv), breaks = sample_expressions(
+                    [expr, derivative], x, -5, 5, graph_settings)
+                
                 graph_data = {
-                    "type": "polynomial",
-                    "points": [{"x": x_val, "y": float(y_val)} for x_val, y_val in zip(x_vals, y_vals)],
-                    "roots": [float(sol) for sol in solutions if sol.is_real]
+                    "type": "function_comparison",
+                    "function": to_points(x_vals, y_vals_orig),
+                    "derivative": to_points(x_vals, y_vals_deriv),
+                    "discontinuities": breaks
                 }
-            except Exception as e:
+            except Exception:
                 # If graphing fails, continue without it
                 pass
-
-        elif problem_type == "geometry":
-            steps.append(f"Geometry problem type: {sub_type}")
-            
-            try:
-                # Parse the expression to extract values
-                params = {}
-                for part in expression.split(';'):
-                    if '=' in part:
-                        key, value = part.split('=')
-                        params[key.strip()] = float(value.strip())
                 
-                if sub_type == "circle_area":
-                    if 'radius' in params:
-                        r = params['radius']
-                        steps.append(f"Circle with radius = {r}")
-                        steps.append(f"Area of a circle: A = π × r²")
-                        area = pi * r**2
-                        steps.append(f"A = π × {r}² = {area}")
-                        solution = f"Area = {area}"
-                        graph_data = {
-                            "type": "circle",
-                            "radius": float(r)
-                        }
-                        
-                elif sub_type == "circle_circumference":
-                    if 'radius' in params:
-                        r = params['radius']
-                        steps.append(f"Circle with radius = {r}")
-                        steps.append(f"Circumference of a circle: C = 2π × r")
-                        circumference = 2 * pi * r
-                        steps.append(f"C = 2π × {r} = {circumference}")
-                        solution = f"Circumference = {circumference}"
-                        graph_data = {
-                            "type": "circle",
-                            "radius": float(r)
-                        }
-                        
-                elif sub_type == "triangle_area":
-                    if 'base' in params and 'height' in params:
-                        b = params['base']
-                        h = params['height']
-                        steps.append(f"Triangle with base = {b} and height = {h}")
-                        steps.append(f"Area of a triangle: A = (b × h) / 2")
-                        area = (b * h) / 2
-                        steps.append(f"A = ({b} × {h}) / 2 = {area}")
-                        solution = f"Area = {area}"
-                        graph_data = {
-                            "type": "triangle",
-                            "base": float(b),
-                            "height": float(h)
-                        }
-                        
-                elif sub_type == "rectangle_area":
-                    if 'length' in params and 'width' in params:
-                        l = params['length']
-                        w = params['width']
-                        steps.append(f"Rectangle with length = {l} and width = {w}")
-                        steps.append(f"Area of a rectangle: A = l × w")
-                        area = l * w
-                        steps.append(f"A = {l} × {w} = {area}")
-                        solution = f"Area = {area}"
-                        graph_data = {
-                            "type": "rectangle",
-                            "length": float(l),
-                            "width": float(w)
-                        }
-                        
-                elif sub_type == "sphere_volume":
-                    if 'radius' in params:
-                        r = params['radius']
-                        steps.append(f"Sphere with radius = {r}")
-                        steps.append(f"Volume of a sphere: V = (4/3) × π × r³")
-                        volume = (4/3) * pi * r**3
-                        steps.append(f"V = (4/3) × π × {r}³ = {volume}")
-                        solution = f"Volume = {volume}"
-                        graph_data = {
-                            "type": "sphere",
-                            "radius": float(r)
-                        }
-                        
-                else:
-                    return jsonify({"error": "Unsupported geometry sub-type"}), 400
-                    
-            except Exception as e:
-                return jsonify({"error": f"Error in geometry calculation: {str(e)}"}), 400
+        except Exception as e:
+            return {"error": f"Error in differentiation: {str(e)}"}, 400
+
+    elif problem_type == "integration":
+        steps.add("Expression to integrate: {}", expression)
+        
+        try:
+            expr = parse_math(expression)
+            bounds = parse_interval(options.get('bounds'), "bounds", allow_infinite=True)
+        except (TypeError, ValueError) as e:
+            return {"error": f"Error in integration: {str(e)}"}, 400
 
-        elif problem_type == "differentiation":
-            steps.append(f"Expression to differentiate: {expression}")
-            steps.append("Find the derivative with respect to x")
+        try:
+            if bounds is None:
+                steps.append("Find the indefinite integral with respect to x")
+                integral, tier = integrate_tiered(expr, x)
+                if integral is None:
+                    return {"error": f"No antiderivative found within {INTEGRATION_DEADLINE:g} seconds; "
+                                     "give bounds for a numeric definite integral"}, 504
+                with timed_stage("steps"):
+                    steps.append(INTEGRATION_METHODS[tier])
+                    steps.add("The indefinite integral is: {} + C", integral)
+                    solution = f"∫{expression} dx = {integral} + C"
+            else:
+                lower, upper = bounds
+                steps.append(f"Find the definite integral with respect to x from {lower} to {upper}")
+                value, tier = definite_integral(expr, x, lower, upper)
+                with timed_stage("steps"):
+                    steps.append(INTEGRATION_METHODS[tier])
+                    if value is None:
+                        steps.append("The integral diverges")
+                        solution = f"∫[{lower}, {upper}] {expression} dx diverges"
+                    else:
+                        relation = "≈" if tier == "numeric" else "="
+                        steps.add("The definite integral is approximately {}" if tier == "numeric"
+                                  else "The definite integral is {}", value)
+                        solution = f"∫[{lower}, {upper}] {expression} dx {relation} {value}"
             
+            # Prepare graph data for Flutter
             try:
-                expr = safe_eval(expression)
-                derivative = diff(expr, x)
-                steps.append(f"Apply the rules of differentiation")
-                steps.append(f"The derivative is: {derivative}")
-                solution = f"f'(x) = {derivative}"
-                
-                # Prepare graph data for Flutter
-                try:
-                    x_vals = list(range(-5, 6))
-                    y_vals_orig = [float(expr.subs(x, x_val)) for x_val in x_vals]
-                    y_vals_deriv = [float(derivative.subs(x, x_val)) for x_val in x_vals]
+                if bounds is None:
+                    x_vals, (y_vals_orig, y_vals_integ), breaks = sample_expressions(
+                        [expr, integral], x, -5, 5, graph_settings)
                     
                     graph_data = {
                         "type": "function_comparison",
-                        "function": [{"x": x_val, "y": y_val} for x_val, y_val in zip(x_vals, y_vals_orig)],
-                        "derivative": [{"x": x_val, "y": y_val} for x_val, y_val in zip(x_vals, y_vals_deriv)]
+                        "function": to_points(x_vals, y_vals_orig),
+                        "integral": to_points(x_vals, y_vals_integ),
+                        "discontinuities": breaks
                     }
-                except Exception:
-                    # If graphing fails, continue without it
-                    pass
-                    
-            except Exception as e:
-                return jsonify({"error": f"Error in differentiation: {str(e)}"}), 400
-
-        elif problem_type == "integration":
-            steps.append(f"Expression to integrate: {expression}")
-            steps.append("Find the indefinite integral with respect to x")
-            
-            try:
-                expr = safe_eval(expression)
-                integral = integrate(expr, x)
-                steps.append(f"Apply the rules of integration")
-                steps.append(f"The indefinite integral is: {integral} + C")
-                solution = f"∫{expression} dx = {integral} + C"
-                
-                # Prepare graph data for Flutter
-                try:
-                    x_vals = list(range(-5, 6))
-                    y_vals_orig = [float(expr.subs(x, x_val)) for x_val in x_vals]
-                    y_vals_integ = [float(integral.subs(x, x_val)) for x_val in x_vals]
+                else:
+                    # Show the area with a margin on each side; infinite bounds fall back to [-5, 5]
+                    low = float(lower) if lower.is_finite else min(-5.0, float(upper) - 5 if upper.is_finite else -5.0)
+                    high = float(upper) if upper.is_finite else max(5.0, low + 5)
+                    low, high = min(low, high), max(low, high)
+                    margin = max(high - low, 1.0) * 0.25
+                    x_vals, (y_vals,), breaks = sample_expressions(
+                        [expr], x, low - margin, high + margin, graph_settings)
                     
                     graph_data = {
-                        "type": "function_comparison",
-                        "function": [{"x": x_val, "y": y_val} for x_val, y_val in zip(x_vals, y_vals_orig)],
-                        "integral": [{"x": x_val, "y": y_val} for x_val, y_val in zip(x_vals, y_vals_integ)]
+                        "type": "definite_integral",
+                        "function": to_points(x_vals, y_vals),
+                        "discontinuities": breaks,
+                        # JSON has no infinity, so infinite bounds and divergent values are null
+                        "lower": float(lower) if lower.is_finite else None,
+                        "upper": float(upper) if upper.is_finite else None,
+                        "value": float(value) if value is not None and value.is_real else None
                     }
-                except Exception:
-                    # If graphing fails, continue without it
-                    pass
-                    
-            except Exception as e:
-                return jsonify({"error": f"Error in integration: {str(e)}"}), 400
-
-        elif problem_type == "trigonometry":
-            if '=' not in expression:
-                return jsonify({"error": "Trigonometric equation must contain an equals sign"}), 400
+            except Exception:
+                # If graphing fails, continue without it
+                pass
                 
-            lhs, rhs = expression.split('=')
-            lhs_expr = safe_eval(lhs.strip())
-            rhs_expr = safe_eval(rhs.strip())
-            eq = Eq(lhs_expr, rhs_expr)
-            
-            steps.append(f"Trigonometric equation: {lhs} = {rhs}")
+        except Exception as e:
+            return {"error": f"Error in integration: {str(e)}"}, 400
+        details = {"method": tier}
+
+    elif problem_type == "trigonometry":
+        if '=' not in expression:
+            return {"error": "Trigonometric equation must contain an equals sign"}, 400
             
-            # Try to identify the variable
-            var_to_solve = None
-            for var in [x, y, z]:
-                if var in lhs_expr.free_symbols or var in rhs_expr.free_symbols:
-                    var_to_solve = var
-                    break
-                    
-            if not var_to_solve:
-                return jsonify({"error": "No variable found in equation"}), 400
+        lhs, rhs = expression.split('=')
+        lhs_expr = parse_math(lhs.strip())
+        rhs_expr = parse_math(rhs.strip())
+        eq = Eq(lhs_expr, rhs_expr)
+        
+        steps.append(f"Trigonometric equation: {lhs} = {rhs}")
+        
+        # Try to identify the variable
+        var_to_solve = None
+        for var in [x, y, z]:
+            if var in lhs_expr.free_symbols or var in rhs_expr.free_symbols:
+                var_to_solve = var
+                break
                 
-            steps.append(f"Solve for {var_to_solve}")
+        if not var_to_solve:
+            return {"error": "No variable found in equation"}, 400
             
+        steps.append(f"Solve for {var_to_solve}")
+        expr = lhs_expr - rhs_expr
+
+        if expr.free_symbols != {var_to_solve}:
+            # Parameters rule out a numeric scan, so only symbolic solving is left
             try:
-                solutions = solve(eq, var_to_solve)
-                
-                if solutions:
-                    # Filter out complex solutions
-                    real_solutions = [sol for sol in solutions if sol.is_real]
-                    
-                    if real_solutions:
-                        steps.append(f"Found {len(real_solutions)} real solution(s)")
-                        # Get one period of solutions
-                        solutions_in_period = []
-                        for sol in real_solutions:
-                            solutions_in_period.append(f"{var_to_solve} = {sol}")
-                            steps.append(f"General solution: {var_to_solve} = {sol} + 2πn, where n is an integer")
-                        
-                        solution = " or ".join(solutions_in_period)
-                        
-                        # Prepare graph data for Flutter
-                        try:
-                            x_vals = [i/10 for i in range(-31, 32)]  # -π to π
-                            expr = lhs_expr - rhs_expr
-                            y_vals = [float(expr.subs(var_to_solve, x_val)) for x_val in x_vals]
-                            
-                            graph_data = {
-                                "type": "trigonometric",
-                                "points": [{"x": x_val, "y": y_val} for x_val, y_val in zip(x_vals, y_vals)],
-                                "solutions": [float(sol) for sol in real_solutions]
-                            }
-                        except Exception:
-                            # If graphing fails, continue without it
-                            pass
-                    else:
-                        steps.append("No real solutions found")
-                        solution = "No real solutions"
-                else:
-                    steps.append("No solutions found")
-                    solution = "No solution"
+                solutions = [sol for sol in solve(eq, var_to_solve) if sol.is_real]
             except Exception as e:
-                return jsonify({"error": f"Error solving trigonometric equation: {str(e)}"}), 400
+                return {"error": f"Error solving trigonometric equation: {str(e)}"}, 400
+            if solutions:
+                steps.append(f"Found {len(solutions)} real solution(s)")
+                solution = " or ".join(f"{var_to_solve} = {sol}" for sol in solutions)
+            else:
+                steps.append("No real solutions found")
+                solution = "No real solutions"
+            return {"solution": solution, "steps": steps.render()}, 200
 
-        elif problem_type == "limit":
-            steps.append(f"Limit problem: {expression}")
-            
-            # Parse limit expression
-            if expression.startswith("limit"):
-                # Extract variable, point, and expression from the limit notation
-                match = re.match(r"limit\(\s*(\w+)\s*,\s*([^,]+)\s*,\s*(.+)\s*\)", expression)
-                if match:
-                    var_str, point_str, expr_str = match.groups()
-                    
-                    # Determine the variable
-                    if var_str == 'x':
-                        var = x
-                    elif var_str == 'y':
-                        var = y
-                    elif var_str == 'z':
-                        var = z
-                    else:
-                        return jsonify({"error": f"Unsupported variable: {var_str}"}), 400
-                    
-                    point = safe_eval(point_str)
-                    expr = safe_eval(expr_str)
-                    
-                    steps.append(f"Computing the limit of {expr} as {var} approaches {point}")
-                    
-                    try:
-                        from sympy import limit as sympy_limit
-                        result = sympy_limit(expr, var, point)
-                        steps.append(f"Apply limit rules and evaluate")
-                        steps.append(f"The limit equals {result}")
-                        solution = f"lim({var_str}→{point}) {expr_str} = {result}"
-                        
-                        # Prepare graph data for Flutter
-                        try:
-                            # Generate points around the limit point for graphing
-                            epsilon = 0.1
-                            x_vals = [point - epsilon * (10-i)/10 for i in range(10)]
-                            x_vals.extend([point + epsilon * (i+1)/10 for i in range(10)])
-                            
-                            # Calculate function values
-                            y_vals = []
-                            for x_val in x_vals:
-                                try:
-                                    y_val = float(expr.subs(var, x_val))
-                                    y_vals.append(y_val)
-                                except:
-                                    y_vals.append(None)  # Handle undefined points
-                            
-                            graph_data = {
-                                "type": "limit",
-                                "points": [{"x": float(x_val), "y": y_val} for x_val, y_val in zip(x_vals, y_vals) if y_val is not None],
-                                "limitPoint": float(point),
-                                "limitValue": float(result) if result.is_real else None
-                            }
-                        except Exception:
-                            # If graphing fails, continue without it
-                            pass
-                    except Exception as e:
-                        return jsonify({"error": f"Error computing limit: {str(e)}"}), 400
-                else:
-                    return jsonify({"error": "Invalid limit syntax. Use format: limit(x, a, f(x))"}), 400
+        try:
+            interval = parse_interval(options.get('interval'), "interval") or TRIG_INTERVAL
+            low, high = sorted(float(bound) for bound in interval)
+            if low == high:
+                raise ValueError("interval must not be empty")
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid interval: {str(e)}"}, 400
+
+        try:
+            with deadline(TRIG_SYMBOLIC_SECONDS):
+                period = periodicity(expr, var_to_solve)
+        except Exception:
+            period = None
+        # Symbolic solving gives exact forms, but only small periodic equations solve quickly;
+        # roots of equations with decimals are no more exact than the numeric ones
+        exact_roots = []
+        if (period is not None and not expr.has(Float)
+                and measure_expression(expr)["operations"] <= TRIG_SYMBOLIC_MAX_OPS):
+            try:
+                with deadline(TRIG_SYMBOLIC_SECONDS):
+                    exact_roots = [sol for sol in solve(eq, var_to_solve) if sol.is_real]
+            except Exception:
+                exact_roots = []
+
+        try:
+            # Keep the grid at least as fine over each period as the default scan
+            points = ROOT_SCAN_POINTS
+            if period is not None:
+                points = int(min(MAX_ROOT_SCAN_POINTS, max(points, (high - low) / float(period) * ROOT_SCAN_POINTS)))
+            roots = find_real_roots(expr, var_to_solve, low, high, points)
+            if period is not None:
+                # Roots within one period give the general solution
+                base_roots = find_real_roots(expr, var_to_solve, 0.0, float(period))
+                base_roots = base_roots[base_roots < float(period) * (1 - 1e-12)]
+        except Exception as e:
+            return {"error": f"Error solving trigonometric equation: {str(e)}"}, 400
+
+        with timed_stage("steps"):
+            steps.append(f"Scan [{low:.10g}, {high:.10g}] for sign changes and refine each root by bisection")
+            if period is not None:
+                steps.append(f"The equation is periodic with period {period}")
+                for root in base_roots[:MAX_REPORTED_ROOTS] if steps.enabled else ():
+                    offset = "" if root == 0 else f"{_format_root(float(root), exact_roots, period)} + "
+                    steps.append(f"General solution: {var_to_solve} = {offset}{period}·n, where n is an integer")
+            else:
+                steps.append("The equation is not periodic, so only the roots in the interval are reported")
+            if len(roots):
+                steps.append(f"Found {len(roots)} real solution(s) in the interval")
+                shown = [f"{var_to_solve} = {_format_root(float(root), exact_roots, period)}"
+                         for root in roots[:MAX_REPORTED_ROOTS]]
+                if len(roots) > MAX_REPORTED_ROOTS:
+                    shown.append(f"... ({len(roots) - MAX_REPORTED_ROOTS} more)")
+                solution = " or ".join(shown)
             else:
-                return jsonify({"error": "Invalid limit syntax. Use format: limit(x, a, f(x))"}), 400
+                steps.append("No real solutions found in the interval")
+                solution = f"No real solutions in [{low:.10g}, {high:.10g}]"
 
-        elif problem_type == "statistics":
-            if sub_type:
-                steps.append(f"Statistical analysis: {sub_type}")
+        # Prepare graph data for Flutter
+        try:
+            x_vals, (y_vals,), breaks = sample_expressions(
+                [expr], var_to_solve, low, high, graph_settings)
+
+            graph_data = {
+                "type": "trigonometric",
+                "points": to_points(x_vals, y_vals),
+                "discontinuities": breaks,
+                "solutions": roots[:MAX_REPORTED_ROOTS].tolist()
+            }
+            if period is not None:
+                graph_data["period"] = float(period)
+        except Exception:
+            # If graphing fails, continue without it
+            pass
+
+    elif problem_type == "limit":
+        steps.add("Limit problem: {}", expression)
+        
+        # Parse limit expression
+        if expression.startswith("limit"):
+            # Extract variable, point, and expression from the limit notation
+            match = re.match(r"limit\(\s*(\w+)\s*,\s*([^,]+)\s*,\s*(.+)\s*\)", expression)
+            if match:
+                var_str, point_str, expr_str = match.groups()
+                
+                # Determine the variable
+                if var_str == 'x':
+                    var = x
+                elif var_str == 'y':
+                    var = y
+                elif var_str == 'z':
+                    var = z
+                else:
+                    return {"error": f"Unsupported variable: {var_str}"}, 400
+                
+                point = parse_math(point_str)
+                expr = parse_math(expr_str)
+                
+                direction = options.get('direction', "+-")
+                if direction not in LIMIT_DIRECTIONS:
+                    return {"error": f"direction must be one of: {', '.join(LIMIT_DIRECTIONS)}"}, 400
+                arrow = f"{point}{direction}" if point.is_finite and direction != "+-" else f"{point}"
+                
+                steps.add("Computing the limit of {} as {} approaches {}", expr, var, arrow)
                 
                 try:
-                    # Parse the data
-                    if expression.startswith("data ="):
-                        data_str = expression.replace("data =", "").strip()
-                        data = eval(data_str, {"__builtins__": {}}, {})
-                        
-                        if not isinstance(data, list):
-                            return jsonify({"error": "Data must be a list of numbers"}), 400
-                            
-                        steps.append(f"Data set: {data}")
+                    result, method, confident, sides = evaluate_limit(expr, var, point, direction)
+                    if method is None:
+                        return {"error": f"The limit could not be determined within {LIMIT_DEADLINE:g} seconds"}, 504
+                    with timed_stage("steps"):
+                        steps.append(LIMIT_METHODS[method])
+                        if result is None:
+                            one_sided = ", ".join(f"{side}: {value}" for side, value in sides.items())
+                            if not sides:
+                                steps.append("The expression oscillates without settling on a value")
+                                solution = f"lim({var_str}→{arrow}) {expr_str} does not exist"
+                            elif confident:
+                                steps.append(f"The one-sided limits differ ({one_sided})")
+                                solution = f"lim({var_str}→{arrow}) {expr_str} does not exist"
+                            else:
+                                steps.append(f"The one-sided limits appear to differ (estimates {one_sided})")
+                                solution = f"lim({var_str}→{arrow}) {expr_str} appears not to exist"
+                        else:
+                            relation = "=" if confident else "≈"
+                            steps.add(f"The limit {'equals' if confident else 'is approximately'} {{}}", result)
+                            solution = f"lim({var_str}→{arrow}) {expr_str} {relation} {result}"
+                    details = {"method": method, "confident": confident}
+                    
+                    # Prepare graph data for Flutter
+                    try:
+                        # Points around the limit point, or out towards infinity
+                        if point is oo or point is -oo:
+                            low, high = (1.0, 100.0) if point is oo else (-100.0, -1.0)
+                        else:
+                            epsilon = 0.1
+                            low, high = float(point) - epsilon, float(point) + epsilon
+                        x_vals, (y_vals,), breaks = sample_expressions(
+                            [expr], var, low, high, graph_settings)
                         
-                        # Prepare graph data for Flutter
                         graph_data = {
-                            "type": "statistics",
-                            "data": data,
-                            "subType": sub_type
+                            "type": "limit",
+                            "points": to_points(x_vals, y_vals),
+                            "discontinuities": breaks,
+                            # JSON has no infinity, so infinite points and values are null
+                            "limitPoint": float(point) if point.is_finite else None,
+                            "limitValue": float(result) if result is not None and result.is_finite and result.is_real else None
                         }
-                        
-                        if sub_type == "mean":
-                            mean = sum(data) / len(data)
-                            steps.append(f"Calculate the mean: sum(data) / n")
-                            steps.append(f"Mean = ({' + '.join(map(str, data))}) / {len(data)} = {mean}")
-                            solution = f"Mean = {mean}"
-                            graph_data["result"] = mean
-                            
-                        elif sub_type == "median":
-                            sorted_data = sorted(data)
-                            steps.append(f"Sort the data: {sorted_data}")
-                            
-                            n = len(sorted_data)
-                            if n % 2 == 0:  # Even number of elements
-                                median = (sorted_data[n//2 - 1] + sorted_data[n//2]) / 2
-                                steps.append(f"For even number of elements, median = (data[n/2 - 1] + data[n/2]) / 2")
-                                steps.append(f"Median = ({sorted_data[n//2 - 1]} + {sorted_data[n//2]}) / 2 = {median}")
-                            else:  # Odd number of elements
-                                median = sorted_data[n//2]
-                                steps.append(f"For odd number of elements, median = data[n/2]")
-                                steps.append(f"Median = {median}")
-                                
-                            solution = f"Median = {median}"
-                            graph_data["result"] = median
-                            
-                        elif sub_type == "mode":
-                            from collections import Counter
-                            counter = Counter(data)
-                            most_common = counter.most_common()
-                            
-                            if most_common[0][1] > 1:  # Check if any value appears more than once
-                                mode_values = [val for val, count in most_common if count == most_common[0][1]]
-                                steps.append(f"Find the value(s) that appear most frequently")
-                                steps.append(f"Mode = {mode_values}")
-                                solution = f"Mode = {mode_values}"
-                                graph_data["result"] = mode_values
-                            else:
-                                steps.append("No value appears more than once")
-                                solution = "No mode (all values appear exactly once)"
-                                graph_data["result"] = "No mode"
-                                
-                        elif sub_type == "standard_deviation":
-                            n = len(data)
-                            mean = sum(data) / n
-                            variance = sum((x - mean) ** 2 for x in data) / n
-                            std_dev = variance ** 0.5
-                            
-                            steps.append(f"Calculate the mean: {mean}")
-                            steps.append(f"Calculate the variance: sum((x - mean)² for each x in data) / n")
-                            steps.append(f"Variance = {variance}")
-                            steps.append(f"Standard deviation = √variance = {std_dev}")
-                            solution = f"Standard Deviation = {std_dev}"
-                            graph_data["result"] = std_dev
-                            
-                        elif sub_type == "variance":
-                            n = len(data)
-                            mean = sum(data) / n
-                            variance = sum((x - mean) ** 2 for x in data) / n
-                            
-                            steps.append(f"Calculate the mean: {mean}")
-                            steps.append(f"Calculate the variance: sum((x - mean)² for each x in data) / n")
-                            steps.append(f"Variance = {variance}")
-                            solution = f"Variance = {variance}"
-                            graph_data["result"] = variance
-                            
-                        elif sub_type == "range":
-                            data_range = max(data) - min(data)
-                            steps.append(f"Find the minimum value: {min(data)}")
-                            steps.append(f"Find the maximum value: {max(data)}")
-                            steps.append(f"Calculate range = max - min = {max(data)} - {min(data)} = {data_range}")
-                            solution = f"Range = {data_range}"
-                            graph_data["result"] = data_range
-                            
-                        else:
-                            return jsonify({"error": f"Unsupported statistics sub-type: {sub_type}"}), 400
-                    else:
-                        return jsonify({"error": "Invalid data format. Use: data = [x1, x2, ...]"}), 400
+                    except Exception:
+                        # If graphing fails, continue without it
+                        pass
                 except Exception as e:
-                    return jsonify({"error": f"Error in statistical calculation: {str(e)}"}), 400
+                    return {"error": f"Error computing limit: {str(e)}"}, 400
             else:
-                return jsonify({"error": "Statistics sub-type is required"}), 400
+                return {"error": "Invalid limit syntax. Use format: limit(x, a, f(x))"}, 400
         else:
-            return jsonify({"error": f"Unsupported problem type: {problem_type}"}), 400
+            return {"error": "Invalid limit syntax. Use format: limit(x, a, f(x))"}, 400
 
-        # Prepare the response with solution, steps, and graph data
-        response = {
-            "solution": solution,
-            "steps": steps
-        }
-        
-        if graph_data:
-            response["graph_data"] = graph_data
-            
-        return jsonify(response)
+    elif problem_type == "statistics":
+        if not sub_type:
+            return {"error": "Statistics sub-type is required"}, 400
+        try:
+            data = parse_dataset(expression)
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+        return solve_statistics(data, sub_type, steps, output)
+
+    else:
+        return {"error": f"Unsupported problem type: {problem_type}"}, 400
+
+    # Prepare the response with solution, steps, and graph data
+    response = {
+        "solution": solution,
+        "steps": steps.render()
+    }
+    
+    if graph_data:
+        response["graph_data"] = graph_data
+    response.update(details)
         
+    return response, 200
+
+# Body types accepted as a raw statistics dataset, with type/subType in the query string
+RAW_DATA_TYPES = ("application/octet-stream", "text/csv", "text/plain")
+
+def solve_raw_statistics():
+    """Solve a statistics problem whose dataset is the raw request body."""
+    if request.args.get('type', 'statistics') != 'statistics':
+        return jsonify({"error": "Raw request bodies are only supported for statistics"}), 400
+    sub_type = request.args.get('subType', '')
+    if not sub_type:
+        return jsonify({"error": "Statistics sub-type is required"}), 400
+    verbosity = request.args.get('verbosity', "full")
+    if verbosity not in VERBOSITY_LEVELS:
+        return jsonify({"error": f"verbosity must be one of: {', '.join(VERBOSITY_LEVELS)}"}), 400
+    output = request.args.get('output', "numeric")
+    if output not in OUTPUT_MODES:
+        return jsonify({"error": f"output must be one of: {', '.join(OUTPUT_MODES)}"}), 400
+    with tracked_request("statistics", sub_type) as outcome:
+        try:
+            with bulkhead_slot("statistics"):
+                response, status, stage_seconds = run_timed(_solve_raw_dataset, sub_type, verbosity, output)
+        except BulkheadFull as e:
+            (response, status), stage_seconds = shed_response(e), None
+        outcome["status"] = status
+        return serialize_response("statistics", sub_type, response, status, stage_seconds)
+
+def _solve_raw_dataset(sub_type, verbosity, output):
+    try:
+        if request.mimetype == "application/octet-stream":
+            data = read_float64_stream(request.stream)
+        else:
+            data = parse_dataset(request.get_data(as_text=True))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return solve_statistics(data, sub_type, StepLog(verbosity), output)
+
+# Graph payload formats: "points" (the default list of {x, y}), "columnar" (shared
+# xs plus ys arrays) and "binary" (columnar, as base64 little-endian float32)
+GRAPH_FORMATS = ("points", "columnar", "binary")
+GRAPH_MEDIA_TYPES = {
+    "application/vnd.mathsolver.graph-columnar+json": "columnar",
+    "application/vnd.mathsolver.graph-binary+json": "binary"
+}
+
+def graph_format(data=None):
+    """Pick the graph format from a "graphFormat" field, else from the Accept header."""
+    requested = data.get('graphFormat') if isinstance(data, dict) else None
+    if requested is not None:
+        if requested not in GRAPH_FORMATS:
+            raise ValueError(f"graphFormat must be one of: {', '.join(GRAPH_FORMATS)}")
+        return requested
+    best = request.accept_mimetypes.best_match(["application/json", *GRAPH_MEDIA_TYPES],
+                                               default="application/json")
+    return GRAPH_MEDIA_TYPES.get(best, "points")
+
+def _is_series(value):
+    return (isinstance(value, list) and len(value) > 0 and isinstance(value[0], dict)
+            and value[0].keys() == {"x", "y"})
+
+def _encode_column(values, binary):
+    if not binary:
+        return values
+    column = np.array([np.nan if value is None else value for value in values], dtype='<f4')
+    return base64.b64encode(column.tobytes()).decode('ascii')
+
+def encode_graph_data(response, fmt):
+    """Return the response with its point series re-encoded; the input is never modified.
+
+    In the compact formats every series becomes {"ys": [...]} and the x values are
+    stored once as graph_data["xs"] when all series share them (each series keeps
+    its own "xs" otherwise). Undefined points are null, or NaN in binary.
+    """
+    graph_data = response.get("graph_data") if isinstance(response, dict) else None
+    if fmt == "points" or not isinstance(graph_data, dict):
+        return response
+    columns = {key: ([point["x"] for point in value], [point["y"] for point in value])
+               for key, value in graph_data.items() if _is_series(value)}
+    if not columns:
+        return response
+
+    binary = fmt == "binary"
+    encoded = {key: value for key, value in graph_data.items() if key not in columns}
+    x_columns = [xs for xs, _ in columns.values()]
+    shared = all(xs == x_columns[0] for xs in x_columns[1:])
+    if shared:
+        encoded["xs"] = _encode_column(x_columns[0], binary)
+    for key, (xs, ys) in columns.items():
+        encoded[key] = {"ys": _encode_column(ys, binary)}
+        if not shared:
+            encoded[key]["xs"] = _encode_column(xs, binary)
+    encoded["format"] = fmt
+    if binary:
+        encoded["dtype"] = "float32"
+    return dict(response, graph_data=encoded)
+
+# Response compression for clients that send Accept-Encoding
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+
+@lru_cache(maxsize=None)
+def _brotli():
+    """The optional brotli module, or None when it is not installed."""
+    try:
+        return importlib.import_module("brotli")
+    except ImportError:
+        return None
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype.endswith("json") or response.mimetype == "text/plain")):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encodings = ["br", "gzip"] if _brotli() is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding == "br":
+        data = _brotli().compress(data, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ from the identity ones, so the ETag can only be weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def serialize_response(problem_type, sub_type, response, status, stage_seconds=None):
+    """jsonify a solver response, recording the serialize stage along with any others."""
+    start = time.perf_counter()
+    body = jsonify(response)
+    stage_seconds = dict(stage_seconds or {}, serialize=time.perf_counter() - start)
+    record_stages(problem_type, sub_type, stage_seconds)
+    if status in (429, 503) and "retryAfter" in response:
+        body.headers["Retry-After"] = str(response["retryAfter"])
+    return body, status
+
+def request_etag(data, fmt):
+    """ETag for a /solve request: a hash of everything that determines its answer."""
+    key = json.dumps([SOLVER_VERSION, data.get('type'), data.get('expression'), data.get('subType', ''),
+                      solve_options(data), fmt], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def set_solve_caching(response, etag):
+    response.set_etag(etag)
+    response.last_modified = SOLVER_BUILD_TIME
+    if SOLVE_MAX_AGE > 0:
+        response.cache_control.public = True
+        response.cache_control.max_age = SOLVE_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+    response.vary.add("Accept")
+    return response
+
+# Query parameters that carry JSON values in a GET /solve
+JSON_QUERY_FIELDS = ("graph", "bounds", "interval", "parameterSets")
+
+def query_problem():
+    """Read a GET /solve problem from the query string; structured options are passed as JSON."""
+    data = request.args.to_dict()
+    for field in JSON_QUERY_FIELDS:
+        if field in data:
+            try:
+                data[field] = json.loads(data[field])
+            except ValueError:
+                raise ValueError(f"{field} must be valid JSON")
+    if 'profile' in data:
+        data['profile'] = data['profile'].lower() in ('1', 'true')
+    return data
+
+metrics.describe("solver_not_modified_total", "counter", "Conditional /solve requests answered with 304.")
+
+@app.route('/solve', methods=['GET', 'POST'])
+def solve_problem():
+    """Solves a problem. GET takes the same fields as query parameters and supports
+    conditional requests, so clients and CDNs can revalidate cached answers."""
+    try:
+        if request.method == 'POST' and request.mimetype in RAW_DATA_TYPES:
+            return solve_raw_statistics()
+
+        if request.method == 'POST':
+            data = request.json
+        else:
+            try:
+                data = query_problem()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        problem_type = data.get('type')
+        expression = data.get('expression', '')
+        sub_type = data.get('subType', '')
+        options = solve_options(data)
+        try:
+            fmt = graph_format(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        profile = PROFILING_ENABLED and (request.headers.get('X-Profile', '').lower() in ('1', 'true')
+                                         or data.get('profile') is True)
+
+        # Answers are deterministic, so the ETag is known before solving; profiled
+        # responses differ every time and are never cached
+        bulk = parameter_values(options) > MAX_CACHED_PARAMETER_VALUES
+        etag = None if profile or bulk else request_etag(data, fmt)
+        if etag and request.method == 'GET' and request.if_none_match.contains_weak(etag):
+            metrics.inc("solver_not_modified_total", metric_labels(problem_type, sub_type))
+            return set_solve_caching(Response(status=304), etag)
+
+        response, status = solve_cached(problem_type, expression, sub_type, options, profile=profile)
+        body, status = serialize_response(problem_type, sub_type, encode_graph_data(response, fmt), status)
+        if etag and status == 200:
+            set_solve_caching(body, etag)
+        else:
+            body.vary.add("Accept")
+        return body, status
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Batch solving
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", 10000))
+
+def _solve_batch_item(item, default_format="points"):
+    """Solve one /solve_batch item, turning failures into an error response."""
+    if not isinstance(item, dict):
+        return {"error": "Each batch item must be an object with type and expression"}, 400
+    try:
+        fmt = item.get('graphFormat', default_format)
+        if fmt not in GRAPH_FORMATS:
+            return {"error": f"graphFormat must be one of: {', '.join(GRAPH_FORMATS)}"}, 400
+        response, status = solve_cached(item.get('type'), item.get('expression'), item.get('subType', ''),
+                                        solve_options(item))
+        return encode_graph_data(response, fmt), status
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+@app.route('/solve_batch', methods=['POST'])
+def solve_batch():
+    """Solves many problems in parallel, streaming results as newline-delimited JSON."""
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+
+    if not isinstance(items, list):
+        return jsonify({"error": "Request body must be a list of problems or {\"items\": [...]}"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"Batch is limited to {MAX_BATCH_ITEMS} problems"}), 413
+    try:
+        # Items may override the batch-wide format with their own graphFormat
+        default_format = graph_format(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        # One dispatching thread per solver worker keeps every core busy
+        executor = ThreadPoolExecutor(max_workers=max(1, SOLVER_WORKERS or os.cpu_count() or 1))
+        try:
+            futures = {executor.submit(_solve_batch_item, item, default_format): i for i, item in enumerate(items)}
+            for future in as_completed(futures):
+                response, status = future.result()
+                item = items[futures[future]]
+                start = time.perf_counter()
+                try:
+                    line = json.dumps({"index": futures[future], "status": status, **response})
+                except Exception as e:
+                    line = json.dumps({"index": futures[future], "status": 500, "error": str(e)})
+                if isinstance(item, dict):
+                    record_stages(item.get('type'), item.get('subType', ''),
+                                  {"serialize": time.perf_counter() - start})
+                yield line + "\n"
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# Asynchronous jobs
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", max(1, SOLVER_WORKERS or os.cpu_count() or 1)))
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", 256))
+MAX_RETAINED_JOBS = int(os.environ.get("MAX_RETAINED_JOBS", 10000))
+JOB_RETENTION = float(os.environ.get("JOB_RETENTION", 600))
+MAX_JOB_WAIT = 30
+
+class Job:
+    """A /solve request running in the background."""
+
+    def __init__(self, problem_type, expression, sub_type, options, graph_format="points"):
+        self.id = uuid.uuid4().hex
+        self.problem = (problem_type, expression, sub_type, options)
+        self.graph_format = graph_format
+        self.status = "queued"
+        self.response = None
+        self.http_status = None
+        self.created = time.time()
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.future = None
+
+    def finish(self, status, response=None, http_status=None):
+        self.status = status
+        self.response = response
+        self.http_status = http_status
+        self.finished = time.time()
+        self.done.set()
+
+    def to_dict(self):
+        job = {"jobId": self.id, "status": self.status, "createdAt": self.created}
+        if self.finished is not None:
+            job["finishedAt"] = self.finished
+        if self.response is not None:
+            job["httpStatus"] = self.http_status
+            job["result"] = self.response
+        return job
+
+class JobQueue:
+    """Bounded queue of background solves with time- and size-limited retention."""
+
+    def __init__(self, workers, max_pending, max_retained, retention):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="solve-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_pending = max_pending
+        self.max_retained = max_retained
+        self.retention = retention
+
+    def _pending(self):
+        return sum(1 for job in self._jobs.values() if not job.done.is_set())
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.done.is_set() and (job.finished < cutoff or len(self._jobs) > self.max_retained):
+                del self._jobs[job_id]
+
+    def submit(self, problem_type, expression, sub_type, options, graph_format="points"):
+        """Queue a job, or return None when the queue is full."""
+        with self._lock:
+            self._purge()
+            if self._pending() >= self.max_pending:
+                return None
+            job = Job(problem_type, expression, sub_type, options, graph_format)
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            return
+        job.status = "running"
+        try:
+            response, status = solve_cached(*job.problem, cancel=job.cancel_event)
+        except SolverCancelled:
+            job.finish("cancelled")
+            return
+        except Exception as e:
+            response, status = {"error": str(e)}, 500
+        job.finish("done", encode_graph_data(response, job.graph_format), status)
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        with self._lock:
+            return self._pending()
+
+    def cancel(self, job):
+        """Cancel a queued job outright, or stop a running one at its next check."""
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.finish("cancelled")
+
+job_queue = JobQueue(JOB_WORKERS, MAX_PENDING_JOBS, MAX_RETAINED_JOBS, JOB_RETENTION)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queues a /solve request and returns its job id straight away."""
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a problem object"}), 400
+    try:
+        fmt = graph_format(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job = job_queue.submit(data.get('type'), data.get('expression'), data.get('subType', ''), solve_options(data), fmt)
+    if job is None:
+        response = jsonify({"error": "Too many pending jobs, please retry later"})
+        response.headers["Retry-After"] = "1"
+        return response, 429
+    response = jsonify(job.to_dict())
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response, 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Returns a job's status and result; ?wait=N long-polls up to N seconds."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_JOB_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    if wait > 0:
+        job.done.wait(wait)
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancels a queued or running job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if not job.done.is_set():
+        job_queue.cancel(job)
+    return jsonify(job.to_dict())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint for request, stage, cache and worker metrics."""
+    lines = [metrics.render()]
+    cache = result_cache.stats()
+    gauges = [
+        ("solver_cache_entries", "gauge", "Entries in the result cache.", cache["size"]),
+        ("solver_cache_hits_total", "counter", "Result cache hits.", cache["hits"]),
+        ("solver_cache_misses_total", "counter", "Result cache misses.", cache["misses"]),
+        ("solver_cache_evictions_total", "counter", "Result cache evictions.", cache["evictions"]),
+        ("solver_jobs_pending", "gauge", "Asynchronous jobs queued or running.", job_queue.pending())
+    ]
+    if result_store is not None:
+        store = result_store.stats()
+        gauges += [
+            ("solver_store_rows", "gauge", "Results held in the persistent store.", store["rows"] or 0),
+            ("solver_store_bytes", "gauge", "Bytes of results held in the persistent store.", store["bytes"] or 0),
+            ("solver_store_hits_total", "counter", "Persistent store hits in this process.", store["hits"]),
+            ("solver_store_misses_total", "counter", "Persistent store misses in this process.", store["misses"]),
+            ("solver_store_errors_total", "counter", "Persistent store errors in this process.", store["errors"])
+        ]
+    with _solver_pool_lock:
+        pools = list(_solver_pools.values())
+    if pools:
+        gauges.append(("solver_worker_timeouts_total", "counter", "Workers killed at their deadline.",
+                       sum(pool.timeouts for pool in pools)))
+        gauges.append(("solver_worker_crashes_total", "counter", "Workers that exited unexpectedly.",
+                       sum(pool.crashes for pool in pools)))
+    for name, kind, text, value in gauges:
+        lines.append(f"# HELP {name} {text}\n# TYPE {name} {kind}\n{name} {value}\n")
+    with _bulkheads_lock:
+        bulkheads = list(_bulkheads.values())
+    for name, attr, text in (("solver_bulkhead_active", "active", "Solves holding a bulkhead slot."),
+                             ("solver_bulkhead_queued", "queued", "Requests waiting for a bulkhead slot.")):
+        lines.append(f"# HELP {name} {text}\n# TYPE {name} gauge\n")
+        lines.extend(f'{name}{_format_labels((("type", bulkhead.name),))} {getattr(bulkhead, attr)}\n'
+                     for bulkhead in bulkheads)
+    return Response("".join(lines), mimetype="text/plain; version=0.0.4")
+
+@app.route('/slow_requests', methods=['GET'])
+def get_slow_requests():
+    """Returns the most recent solves that exceeded SLOW_REQUEST_SECONDS."""
+    return jsonify(slow_log.entries())
+
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """Returns hit/miss counters for the /solve result cache and the persistent store."""
+    stats = result_cache.stats()
+    if result_store is not None:
+        stats["store"] = result_store.stats()
+    return jsonify(stats)
+
+@app.cli.command("prewarm")
+@click.argument("corpus", type=click.File("r"))
+@click.option("--workers", default=0, help="Problems solved at once (defaults to the worker count).")
+def prewarm_command(corpus, workers):
+    """Solve every problem in CORPUS and keep the answers in the result store.
+
+    CORPUS holds one JSON problem per line ({"type", "expression", "subType", ...}),
+    or a single JSON array of them.
+    """
+    if result_store is None:
+        raise click.ClickException("The result store is disabled (RESULT_STORE_PATH is empty)")
+    text = corpus.read()
+    try:
+        items = json.loads(text)
+    except ValueError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if not isinstance(items, list):
+        raise click.ClickException("The corpus must be JSON lines or a JSON array of problems")
+
+    statuses = Counter()
+    with ThreadPoolExecutor(max_workers=workers or max(1, SOLVER_WORKERS or os.cpu_count() or 1)) as executor:
+        for _, status in executor.map(_solve_batch_item, items):
+            statuses[status] += 1
+    click.echo(f"Solved {len(items)} problems: " + ", ".join(f"{count} x {status}" for status, count in sorted(statuses.items())))
+    click.echo(f"Store now holds {result_store.stats()['rows']} results for solver version {SOLVER_VERSION}")
+
+# Start-up warm-up
+WARMUP = os.environ.get("WARMUP", "0") == "1"
+# Problem types to warm up (comma separated); all of them by default
+WARMUP_TYPES = [name for name in os.environ.get("WARMUP_TYPES", "").split(",") if name]
+
+# Modules each problem type needs beyond the ones imported at start-up
+TYPE_MODULES = {
+    "quadratic": ("numpy",),
+    "system": ("numpy",),
+    "inequality": ("sympy.solvers.inequalities",),
+    "polynomial": ("numpy",),
+    "differentiation": ("numpy",),
+    "integration": ("numpy",),
+    "trigonometry": ("numpy",),
+    "limit": ("numpy",),
+    "statistics": ("numpy",)
+}
+
+_ready = threading.Event()
+_warmed_types = []
+
+def example_problems(problem_types=None):
+    """Yield (type, expression, subType) for every example in PROBLEM_TYPES."""
+    examples = PROBLEM_TYPES["examples"]
+    subtypes = PROBLEM_TYPES["subtypes"]
+    for problem_type in problem_types or [entry["id"] for entry in PROBLEM_TYPES["types"]]:
+        example = examples.get(problem_type)
+        if isinstance(example, dict):
+            for sub_type, expression in example.items():
+                yield problem_type, expression, sub_type
+        elif problem_type in subtypes:
+            for entry in subtypes[problem_type]:
+                yield problem_type, example, entry["id"]
+        elif example is not None:
+            yield problem_type, example, ''
+
+def warm_up(problem_types=None):
+    """Import and exercise each problem type so the first real requests run at full speed."""
+    try:
+        for problem_type in problem_types or [entry["id"] for entry in PROBLEM_TYPES["types"]]:
+            for module in TYPE_MODULES.get(problem_type, ()):
+                importlib.import_module(module)
+            for _, expression, sub_type in example_problems([problem_type]):
+                try:
+                    # Solving in-process fills SymPy's caches and the parse memo;
+                    # the result cache is seeded with the examples as a bonus
+                    response, status = compute_solution(problem_type, expression, sub_type)
+                    if status == 200:
+                        result_cache.put(cache_key(problem_type, expression, sub_type), response)
+                except Exception:
+                    pass
+            _warmed_types.append(problem_type)
+        # Fork the workers last so they inherit the warm caches
+        if SOLVER_WORKERS > 0:
+            get_solver_pool("fast")
+            get_solver_pool("slow")
+    finally:
+        _ready.set()
+
+def start_warmup():
+    """Run warm-up in the background; /ready reports 503 until it finishes."""
+    _ready.clear()
+    threading.Thread(target=warm_up, args=(WARMUP_TYPES or None,), daemon=True).start()
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once warm-up has finished, 503 before."""
+    status = {"ready": _ready.is_set(), "warmedTypes": list(_warmed_types)}
+    return jsonify(status), 200 if status["ready"] else 503
+
+if WARMUP:
+    start_warmup()
+else:
+    _ready.set()
+
 if __name__ == '__main__':
     app.run(debug=True)
     
\ No newline at end of file
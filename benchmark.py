@@ -0,0 +1,313 @@
+"""Benchmark /solve for every problem type through the Flask test client.
+
+    python benchmark.py                         # run and print a report
+    python benchmark.py --save baseline.json    # keep the results as a baseline
+    python benchmark.py --compare baseline.json # flag regressions (exit code 1)
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+TIERS = ("small", "medium", "adversarial")
+
+def _random_system(size, seed):
+    rng = random.Random(seed)
+    equations = []
+    for _ in range(size):
+        terms = " + ".join(f"{rng.randint(-9, 9)}*v{j}" for j in range(size))
+        equations.append(f"{terms} = {rng.randint(-50, 50)}")
+    return "; ".join(equations)
+
+def _random_data(size, seed):
+    rng = random.Random(seed)
+    return "data = " + json.dumps([round(rng.gauss(50, 15), 3) for _ in range(size)])
+
+# Hand-picked medium and adversarial inputs; the small tier comes from /problem_types.
+# Some adversarial inputs are expected to fail today and show up in the err column.
+EXTRA_CORPUS = {
+    "linear": {
+        "medium": ["3*(x - 4) + 2*x/5 = 7*x - 1"],
+        "adversarial": [" + ".join(f"{i}*x" for i in range(1, 201)) + " = 1"]
+    },
+    "quadratic": {
+        "medium": ["3.5*x**2 - 2.25*x - 7 = 0"],
+        "adversarial": ["x**2 + 1e-12*x + 1e-24 = 0"]
+    },
+    "system": {
+        "medium": ["x + y + z = 6; 2*x - y + 3*z = 9; x - 2*y + z = -2"],
+        "adversarial": [_random_system(60, 1)]
+    },
+    "inequality": {
+        "medium": ["(x - 1)*(x + 2)*(x - 3) >= 0"],
+        "adversarial": ["(x**2 - 2)/(x - 1) < 3"]
+    },
+    "polynomial": {
+        "medium": ["x**6 - 14*x**4 + 49*x**2 - 36 = 0"],
+        "adversarial": ["x**25 - x - 1 = 0"]
+    },
+    "geometry": {
+        "medium": [("radius = 123.456", "circle_area"), ("base = 12.5; height = 3.75", "triangle_area")],
+        "adversarial": [("radius = 1e150", "sphere_volume")]
+    },
+    "differentiation": {
+        "medium": ["sin(x)*exp(x)/(1 + x**2)"],
+        "adversarial": ["tan(sin(cos(x**3)))**4"]
+    },
+    "integration": {
+        "medium": ["x*exp(x)*sin(x)"],
+        "adversarial": ["x**3*log(x)**2"]
+    },
+    "trigonometry": {
+        "medium": ["2*sin(x)**2 - 1 = 0"],
+        "adversarial": ["sin(x) = x/3"]
+    },
+    "limit": {
+        "medium": ["limit(x, oo, (1 + 1/x)**x)"],
+        "adversarial": ["limit(x, 0, x*sin(1/x))"]
+    },
+    "statistics": {
+        "medium": [(_random_data(1000, 2), "median")],
+        "adversarial": [(_random_data(100000, 3), "standard_deviation")]
+    }
+}
+
+# (type, expression, subType, expected solution) answers that must not change
+ANSWER_CHECKS = [
+    # Repeated roots of float polynomials must not split into spurious complex roots
+    ("polynomial", "(x - 1.5)**4 = 0", "", "x = 1.50000000000000"),
+    # Bounded oscillation or a pole inside a function is not a limit
+    ("limit", "limit(x, 0, atan(1/x))", "", "lim(x→0) atan(1/x) does not exist"),
+    ("limit", "limit(x, 0, sin(1/x))", "", "lim(x→0) sin(1/x) does not exist"),
+    # Roots where the curve touches zero are exact and reported once
+    ("trigonometry", "sin(x) = 1", "", "x = -3*pi/2 or x = pi/2"),
+    ("trigonometry", "cos(x) = -1", "", "x = -pi or x = pi"),
+    ("trigonometry", "cos(x) = 1", "", "x = -2*pi or x = 0 or x = 2*pi"),
+]
+
+def _graph(body):
+    return (body.get("graph_data") or {}).get("function") or []
+
+def _breaks(body):
+    return (body.get("graph_data") or {}).get("discontinuities") or []
+
+def _result(body):
+    return (body.get("graph_data") or {}).get("result")
+
+# (description, request, check on (status, response body)) behaviour that must not change
+RESPONSE_CHECKS = [
+    # Separator rows at poles count against the point budget
+    ("tan(x) graph within 100 points",
+     {"type": "differentiation", "expression": "tan(x)", "graph": {"points": 100}},
+     lambda status, body: 0 < len(_graph(body)) <= 100),
+    ("sin(1/x) graph within the default points",
+     {"type": "differentiation", "expression": "sin(1/x)"},
+     lambda status, body: 0 < len(_graph(body)) <= 1001),
+    # Oscillation faster than the starting grid is not aliased away
+    ("tan(10*x) graph finds its poles",
+     {"type": "differentiation", "expression": "tan(10*x)", "graph": {"points": 100}},
+     lambda status, body: len(_breaks(body)) >= 10),
+    # A coarse but continuous curve has no breaks
+    ("sin(10*x) graph has no breaks",
+     {"type": "differentiation", "expression": "sin(10*x)", "graph": {"points": 100}},
+     lambda status, body: len(_graph(body)) > 0 and not _breaks(body)),
+    ("reversed graph viewport is a bad request",
+     {"type": "differentiation", "expression": "x", "graph": {"xMin": 3, "xMax": 1}},
+     lambda status, body: status == 400),
+    ("lone xMin past the default viewport",
+     {"type": "differentiation", "expression": "x", "graph": {"xMin": 30}},
+     lambda status, body: status == 200 and [p["x"] for p in _graph(body)[:1]] == [30]),
+    # Statistics at the float limits neither overflow nor produce invalid JSON
+    ("mean of equal values at the float limit",
+     {"type": "statistics", "expression": "data = [1e308, 1e308]", "subType": "mean"},
+     lambda status, body: status == 200 and _result(body) == 1e308),
+    ("mean of opposite values at the float limit",
+     {"type": "statistics", "expression": "data = [1e308, -1e308]", "subType": "mean"},
+     lambda status, body: status == 200 and _result(body) == 0),
+    ("standard deviation beyond an overflowing variance",
+     {"type": "statistics", "expression": "data = [1e308, -1e308]", "subType": "standard_deviation"},
+     lambda status, body: status == 200 and _result(body) == 1e308),
+    ("variance too large to represent is a bad request",
+     {"type": "statistics", "expression": "data = [1e308, -1e308]", "subType": "variance"},
+     lambda status, body: status == 400),
+]
+
+def check_answers(backend):
+    """Return a message for every ANSWER_CHECKS or RESPONSE_CHECKS entry that fails."""
+    client = backend.app.test_client()
+    wrong = []
+    for problem_type, expression, sub_type, expected in ANSWER_CHECKS:
+        response = client.post('/solve', json={"type": problem_type, "expression": expression, "subType": sub_type})
+        solution = (response.get_json() or {}).get("solution")
+        if solution != expected:
+            wrong.append(f"{problem_type} {expression!r}: expected {expected!r}, got {solution!r}")
+    for description, request, check in RESPONSE_CHECKS:
+        response = client.post('/solve', json=request)
+        if not check(response.status_code, response.get_json() or {}):
+            wrong.append(f"{description}: got {response.status_code} {response.get_data(as_text=True)[:200]!r}")
+    return wrong
+
+def build_corpus(backend, types=None, tiers=TIERS, extra_file=None):
+    """Return {type: [(tier, expression, subType), ...]} for the requested types and tiers."""
+    corpus = {}
+    if "small" in tiers:
+        for problem_type, expression, sub_type in backend.example_problems(types):
+            corpus.setdefault(problem_type, []).append(("small", expression, sub_type))
+    for problem_type, by_tier in EXTRA_CORPUS.items():
+        if types and problem_type not in types:
+            continue
+        for tier in tiers:
+            for item in by_tier.get(tier, []):
+                expression, sub_type = item if isinstance(item, tuple) else (item, "")
+                corpus.setdefault(problem_type, []).append((tier, expression, sub_type))
+    if extra_file:
+        # One JSON object per line: {"type", "expression", "subType", "tier"}
+        with open(extra_file) as handle:
+            for line in handle:
+                if line.strip():
+                    item = json.loads(line)
+                    if types and item["type"] not in types:
+                        continue
+                    corpus.setdefault(item["type"], []).append(
+                        (item.get("tier", "medium"), item["expression"], item.get("subType", "")))
+    return corpus
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_benchmark(backend, corpus, repeat, warmup, verbosity="full"):
+    """Time every corpus entry and measure peak allocations per problem type."""
+    client = backend.app.test_client()
+    results = {}
+    for problem_type, problems in corpus.items():
+        latencies = []
+        errors = 0
+        for _, expression, sub_type in problems:
+            body = {"type": problem_type, "expression": expression, "subType": sub_type, "verbosity": verbosity}
+            for _ in range(warmup):
+                client.post('/solve', json=body)
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = client.post('/solve', json=body)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        # Memory is measured in a separate pass because tracing skews the timings
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        for _, expression, sub_type in problems:
+            client.post('/solve', json={"type": problem_type, "expression": expression, "subType": sub_type,
+                                        "verbosity": verbosity})
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[problem_type] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "mean_ms": statistics.fmean(latencies),
+            "p50_ms": _percentile(latencies, 0.50),
+            "p90_ms": _percentile(latencies, 0.90),
+            "p99_ms": _percentile(latencies, 0.99),
+            "max_ms": max(latencies),
+            "peak_kib": peak / 1024
+        }
+    return results
+
+def compare(results, baseline, threshold, noise_ms):
+    """Return a list of regression messages against a saved baseline."""
+    regressions = []
+    for problem_type, current in results.items():
+        previous = baseline.get("types", {}).get(problem_type)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p90_ms", "peak_kib"):
+            old, new = previous[metric], current[metric]
+            floor = noise_ms if metric.endswith("_ms") else 64
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append(f"{problem_type} {metric}: {old:.2f} -> {new:.2f} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+def print_report(results, baseline=None):
+    header = f"{'type':<16}{'reqs':>6}{'err':>5}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KiB':>11}"
+    if baseline:
+        header += f"{'p50 vs base':>13}"
+    print(header)
+    for problem_type, row in results.items():
+        line = (f"{problem_type:<16}{row['requests']:>6}{row['errors']:>5}{row['p50_ms']:>10.2f}"
+                f"{row['p90_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}{row['peak_kib']:>11.0f}")
+        previous = (baseline or {}).get("types", {}).get(problem_type)
+        if previous:
+            line += f"{(row['p50_ms'] / previous['p50_ms'] - 1) * 100:>+12.0f}%"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /solve for every problem type.")
+    parser.add_argument("--types", help="comma separated problem types (default: all)")
+    parser.add_argument("--tiers", default=",".join(TIERS), help="comma separated tiers: small,medium,adversarial")
+    parser.add_argument("--corpus", help="extra JSONL corpus file")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per input")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed runs per input")
+    parser.add_argument("--workers", action="store_true",
+                        help="solve in the worker pool instead of in-process (memory figures then exclude workers)")
+    parser.add_argument("--verbosity", default="full", help="steps to request: none, summary or full")
+    parser.add_argument("--cache", action="store_true", help="keep the /solve result cache and result store enabled")
+    parser.add_argument("--save", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    parser.add_argument("--noise-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    if not args.workers:
+        os.environ["SOLVER_WORKERS"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import backend
+    if not args.cache:
+        backend.result_cache.maxsize = 0
+        backend.result_store = None
+
+    types = [name for name in (args.types or "").split(",") if name] or None
+    tiers = [name for name in args.tiers.split(",") if name]
+    corpus = build_corpus(backend, types, tiers, args.corpus)
+    results = run_benchmark(backend, corpus, args.repeat, args.warmup, args.verbosity)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+    print_report(results, baseline)
+    wrong = check_answers(backend)
+    for message in wrong:
+        print("WRONG ANSWER", message)
+
+    if args.save:
+        with open(args.save, "w") as handle:
+            json.dump({
+                "meta": {
+                    "created": time.time(),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "repeat": args.repeat,
+                    "tiers": tiers,
+                    "verbosity": args.verbosity,
+                    "workers": args.workers
+                },
+                "types": results
+            }, handle, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold, args.noise_ms)
+        for message in regressions:
+            print("REGRESSION", message)
+        return 1 if regressions or wrong else 0
+    return 1 if wrong else 0
+
+if __name__ == '__main__':
+    sys.exit(main())